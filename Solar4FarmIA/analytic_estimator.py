@@ -0,0 +1,434 @@
+import numpy as np
+from typing import List, Tuple
+from const import ACTIVE_CURRENT, PASSIVE_CURRENT, OPERATION_VOLTAGE, SEASON_NUMBER
+from solar_activity import SolarActivity
+from transitions import SparseTransitions
+from power_system import PowerSystem
+from bot import Bot
+from timer import get_calendar
+
+try:
+    import numba
+except ImportError: # numba is optional, the NumPy backend is used otherwise
+    numba = None
+
+
+LUMPINGS = ("charge", "irradiance") # groupings of the solar states
+BOT_LEVELS = 4 # bot probability levels kept apart, higher ones are gathered
+
+
+def stationary_distribution(transitions: SparseTransitions,
+                            season: int,
+                            rows: np.ndarray = None,
+                            tolerance: float = 1e-12,
+                            max_iterations: int = 100000) -> np.ndarray:
+    """
+    Stationary distribution of a season by sparse power iteration: each iteration
+    is one SparseTransitions.push, in O(observed transitions + N) instead of O(N^2).
+
+    Args:
+        transitions (SparseTransitions): transition model
+        season (int): season index
+        rows (np.ndarray, optional): row each state moves on from. Defaults to its own row.
+        tolerance (float, optional): stopping L1 change. Defaults to 1e-12.
+        max_iterations (int, optional): maximal number of iterations. Defaults to 100000.
+
+    Returns:
+        np.ndarray: stationary distribution
+    """
+    _rows = np.arange(transitions.N) if rows is None else rows
+    _pi = np.full(transitions.N, 1.0 / transitions.N)
+    for _ in range(max_iterations):
+        _next = transitions.push(season, np.bincount(_rows, _pi, transitions.N))
+        if np.abs(_next - _pi).sum() < tolerance:
+            return _next
+        _pi = _next
+    return _pi
+
+
+def _forward_hours(distribution, group_charge, targets, weights, satisfaction,
+                   probabilities, seasons, bot_activity, first_transition, transitions):
+    """
+    Pushes the joint (solar group, bot level, battery) distribution through the
+    simulated hours, compiled by numba. targets[l, c, b] and weights[l, c, b] are
+    the battery states reached from b under load l (passive, active) and charge c,
+    probabilities[h, k] the activation probability of level k at hour h.
+    Returns the expected number of satisfied hours.
+    """
+    groups, levels, batteries = distribution.shape
+    fanout = targets.shape[3]
+    following = np.zeros_like(distribution)
+    satisfied = 0.0
+
+    for h in range(seasons.shape[0]):
+        season = seasons[h]
+        solar = first_transition if h == 0 else transitions[season]
+        probability = probabilities[h]
+        for g in range(groups):
+            c = group_charge[g]
+            for k in range(levels):
+                # activations reset the level, passive activity hours raise it
+                k_passive = k
+                if bot_activity[h]:
+                    k_passive = min(k + 1, levels - 1)
+                p = probability[k]
+                for b in range(batteries):
+                    mass = distribution[g, k, b]
+                    if mass == 0.0:
+                        continue
+                    active = mass * p
+                    passive = mass - active
+                    satisfied += active * satisfaction[1, b] + passive * satisfaction[0, b]
+                    # weights are sorted by decreasing value, zero ones end the fanout
+                    for t in range(fanout):
+                        w = weights[1, c, b, t]
+                        if w == 0.0:
+                            break
+                        for g_next in range(groups):
+                            following[g_next, 0, targets[1, c, b, t]] += active * w * solar[g, g_next]
+                    for t in range(fanout):
+                        w = weights[0, c, b, t]
+                        if w == 0.0:
+                            break
+                        for g_next in range(groups):
+                            following[g_next, k_passive, targets[0, c, b, t]] += passive * w * solar[g, g_next]
+
+        distribution, following = following, distribution
+        following[:] = 0.0
+
+    return satisfied
+
+
+if numba is not None:
+    _forward_hours = numba.njit(cache=True, nogil=True)(_forward_hours)
+
+
+class AnalyticEstimator():
+    """
+    This class allows to estimate the expected user efficiency of power systems
+    without Monte-Carlo, from the Markov chain of the joint (solar group, bot
+    probability level, battery) state:
+
+    - solar states are lumped into groups (states charging the batteries or not,
+      or states of equal irradiance), each state being weighted by the seasonal
+      stationary distribution, computed by power iteration over the sparse
+      transitions (SparseTransitions, built from the counts of dense models);
+    - bot probability levels count the activity hours since the last activation:
+      k hours after it, the probability is the initial one plus k seasonal steps.
+      The first bot_levels - 1 levels are kept apart and the higher ones are
+      gathered in the last level, whose probability at each hour is the mean of
+      the gathered ones under the distribution of the bot alone;
+    - battery charges are discretized on levels spaced by battery_step below the
+      capacity, with mean preserving stochastic rounding, together with the battery
+      in use. Each battery state leads to at most 4 states, so the operator of an
+      hour is sparse.
+
+    The distribution is pushed hour by hour from the state where simulations start
+    (current solar state, bot probability and full batteries) and the probability of
+    satisfying the demand is summed over the simulated hours. This finite horizon
+    matters: both batteries too low is an absorbing state, so the stationary
+    distribution would only tell whether a system ends stuck. The operators are
+    applied with a numba kernel when numba is installed, with NumPy otherwise.
+    Bot levels assume that the simulated months share one season, as the
+    simulated summer does.
+
+        estimator = AnalyticEstimator(solar_model, Bot(**BOT_PARAMETERS))
+        estimator.efficiencies(surface_power_systems())
+
+    Attributes:
+        solar_activity (SolarActivity): fitted solar activity model
+        bot (Bot): bot parameters and initial probability
+        battery_step (float): spacing of the battery levels (A.h)
+        lumping (str): one of LUMPINGS
+        bot_levels (int): number of bot probability levels
+        backend (str): "numba" or "numpy"
+        seasons (np.ndarray): season index of each simulated hour
+        bot_activity (np.ndarray): bot activity mask of each simulated hour
+        probabilities (np.ndarray): bot activation probability of each simulated hour and level
+    """
+
+    def __init__(self,
+                 solar_activity: SolarActivity,
+                 bot: Bot,
+                 battery_step: float = PASSIVE_CURRENT,
+                 lumping: str = "charge",
+                 bot_levels: int = BOT_LEVELS,
+                 backend: str = None) -> None:
+        """
+        Prepares the configuration independent parts: solar states, calendar and
+        bot probability levels.
+
+        Args:
+            solar_activity (SolarActivity): fitted solar activity model
+            bot (Bot): bot parameters and initial probability
+            battery_step (float, optional): spacing of the battery levels. Defaults to PASSIVE_CURRENT,
+            which keeps passive hours exact.
+            lumping (str, optional): one of LUMPINGS. Defaults to "charge".
+            bot_levels (int, optional): number of bot probability levels, the last one gathering
+            the higher ones, None for every level. Defaults to BOT_LEVELS.
+            backend (str, optional): "numba" or "numpy". Defaults to numba when installed.
+        """
+        if backend is None:
+            backend = "numba" if numba is not None else "numpy"
+        assert backend in ("numba", "numpy")
+        assert backend == "numpy" or numba is not None, "numba is not installed"
+        assert battery_step > 0 and lumping in LUMPINGS
+
+        self.solar_activity = solar_activity
+        self.bot = bot
+        self.battery_step = battery_step
+        self.lumping = lumping
+        self.backend = backend
+
+        assert solar_activity.step_minutes == 60 and bot.step_hours == 1.0, \
+            "the analytic estimator models hourly steps"
+        _calendar = get_calendar()
+        self.seasons = np.ascontiguousarray(_calendar.seasons[_calendar.active_months])
+        self.bot_activity = np.ascontiguousarray(_calendar.bot_activity[_calendar.active_months])
+        assert len(np.unique(self.seasons)) == 1, "bot levels need simulated months of a single season"
+
+        self.__transitions = solar_activity.transitions
+        if self.__transitions is None:
+            assert solar_activity.counts is not None, "the analytic estimator needs the transition counts"
+            _counts = solar_activity.counts.reshape(-1)
+            _codes = np.flatnonzero(_counts)
+            self.__transitions = SparseTransitions(_codes, _counts[_codes], SEASON_NUMBER, solar_activity.N)
+
+        _values = [solar_activity.state_value(i) for i in range(solar_activity.N)]
+        self.__irradiances = np.array([_v[1] for _v in _values], dtype=float)
+        self.__rows = np.array([solar_activity.state_index(_v) for _v in _values], dtype=np.int64)
+        self.__stationary = {}
+
+        # k activity hours after an activation, the probability is p0 + k dp until it reaches 1
+        _dp = [bot.dpw, bot.dpsp, bot.dps, bot.dpf][self.seasons[0]]
+        _levels = int(np.ceil((1.0 - bot.initial_probability) / _dp)) + 1 if _dp > 0 else 1
+        _exact = np.minimum(bot.initial_probability + np.arange(_levels) * _dp, 1.0)
+        _initial_level = int(np.argmin(np.abs(_exact - bot.probability)))
+
+        # the bot alone gives the distribution of the levels gathered in the last one
+        self.bot_levels = _levels if bot_levels is None else min(bot_levels, _levels)
+        assert self.bot_levels >= 1
+        _marginal = np.zeros(_levels)
+        _marginal[_initial_level] = 1.0
+        self.probabilities = np.empty((len(self.seasons), self.bot_levels))
+        self.probabilities[:, :-1] = _exact[:self.bot_levels - 1]
+        for h, _bot_activity in enumerate(self.bot_activity.tolist()):
+            _tail = _marginal[self.bot_levels - 1:]
+            self.probabilities[h, -1] = _tail @ _exact[self.bot_levels - 1:] / _tail.sum() if _tail.sum() > 0 \
+                else _exact[self.bot_levels - 1]
+            _passive = _marginal * (1.0 - _exact)
+            _marginal = np.zeros(_levels)
+            _marginal[0] = 1.0 - _passive.sum()
+            if _bot_activity:
+                _marginal[1:] += _passive[:-1]
+                _marginal[-1] += _passive[-1]
+            else:
+                _marginal += _passive
+        self.__initial_level = min(_initial_level, self.bot_levels - 1)
+
+    def efficiencies(self, power_systems: List[PowerSystem]) -> np.ndarray:
+        """
+        Args:
+            power_systems (List[PowerSystem]): evaluated power systems
+
+        Returns:
+            np.ndarray: expected user efficiency (%) of each power system
+        """
+        return np.array([self.efficiency(_ps) for _ps in power_systems])
+
+    def efficiency(self, power_system: PowerSystem) -> float:
+        """
+        Expected user efficiency of a power system over the simulated hours.
+
+        Args:
+            power_system (PowerSystem): evaluated power system
+
+        Returns:
+            float: expected user efficiency (%)
+        """
+        return 100 * self.satisfied_hours(power_system) / len(self.seasons)
+
+    def satisfied_hours(self, power_system: PowerSystem) -> float:
+        """
+        Expected number of satisfied hours of a power system over the simulated hours.
+
+        Args:
+            power_system (PowerSystem): evaluated power system
+
+        Returns:
+            float: expected satisfied hours
+        """
+        _sa = self.solar_activity
+        _capacity = power_system.max_battery_capacity
+
+        def _charges(irradiance):
+            return (irradiance * power_system.solar_area) * power_system.solar_efficiency \
+                / OPERATION_VOLTAGE >= _capacity / 2
+
+        # solar groups and whether they charge the batteries
+        _charge = _charges(self.__irradiances)
+        _keys = _charge if self.lumping == "charge" else self.__irradiances
+        _groups = np.unique(_keys, return_inverse=True)[1].reshape(-1)
+        _group_number = int(_groups.max()) + 1
+        _group_charge = np.zeros(_group_number, dtype=np.int64)
+        _group_charge[_groups] = _charge
+
+        _transitions = np.zeros((SEASON_NUMBER, _group_number, _group_number))
+        for _season in np.unique(self.seasons):
+            _transitions[_season] = self.__group_transitions(_season, _groups, _group_number)
+
+        # the first hour uses the current irradiance and leaves the exact current row
+        _start = np.flatnonzero(_group_charge == _charges(float(_sa.current_state[1])))[0] \
+            if self.lumping == "charge" else _groups[_sa.state_index(_sa.current_state)]
+        _row = self.__transitions.push(self.seasons[0], np.eye(_sa.N)[_sa.state_index(_sa.current_state)])
+        _first_transition = np.zeros((_group_number, _group_number))
+        _first_transition[_start] = np.bincount(_groups, _row, _group_number)
+
+        _targets, _weights, _satisfaction = self.battery_operators(power_system)
+        distribution = np.zeros((_group_number, self.probabilities.shape[1], _targets.shape[2]))
+        distribution[_start, self.__initial_level, -1] = 1.0 # full batteries, on main battery
+
+        _arguments = (distribution, _group_charge, _targets, _weights, _satisfaction, self.probabilities,
+                      self.seasons, self.bot_activity, _first_transition, _transitions)
+        if self.backend == "numba":
+            return float(_forward_hours(*_arguments))
+        return self.__forward_numpy(*_arguments)
+
+    def battery_levels(self, capacity: float) -> np.ndarray:
+        """
+        Args:
+            capacity (float): battery capacity (A.h)
+
+        Returns:
+            np.ndarray: increasing battery levels, from 0 to the capacity by battery_step below it
+        """
+        return np.unique(np.append(capacity - np.arange(0.0, capacity, self.battery_step), 0.0))
+
+    def battery_operators(self, power_system: PowerSystem) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Battery transitions of one hour on the discrete levels, following
+        PowerSystem.next_step. Battery states are (on main battery, main level,
+        backup level) flattened, the last one being both batteries full on the
+        main battery.
+
+        Args:
+            power_system (PowerSystem): evaluated power system
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: reached states and their weights, by decreasing
+            weight, of shape (load, charge, B, 4), load being passive or active, and satisfaction
+            of shape (load, B)
+        """
+        _capacity = power_system.max_battery_capacity
+        _levels = self.battery_levels(_capacity)
+        _n = len(_levels)
+
+        _on_main, _i, _j = np.meshgrid([False, True], np.arange(_n), np.arange(_n), indexing="ij")
+        _on_main, _i, _j = _on_main.reshape(-1), _i.reshape(-1), _j.reshape(-1)
+
+        targets = np.zeros((2, 2, len(_i), 4), dtype=np.int64)
+        weights = np.zeros((2, 2, len(_i), 4))
+        satisfaction = np.zeros((2, len(_i)))
+        for _l, _load in enumerate((PASSIVE_CURRENT, ACTIVE_CURRENT)):
+            _main, _backup = _levels[_i], _levels[_j]
+            _draw_main = _on_main & (_main >= _load) & (_main >= power_system.low_threshold)
+            _to_backup = _on_main & ~_draw_main
+            _draw_backup = ~_draw_main & (_backup >= _load)
+            _to_main = ~_on_main & ~_draw_backup & (_main >= power_system.high_threshold)
+            _draw_main |= _to_main
+            satisfaction[_l] = _draw_main | _draw_backup
+            _next_on_main = (_on_main & ~_to_backup) | _to_main
+
+            _main = _main - np.where(_draw_main, _load, 0.0)
+            _backup = _backup - np.where(_draw_backup, _load, 0.0)
+            for _c in (False, True):
+                _next_main, _next_backup = _main, _backup
+                if _c:
+                    _next_backup = np.where(_draw_main, np.minimum(_backup + _capacity / 2, _capacity), _backup)
+                    _next_main = np.where(_draw_backup, np.minimum(_main + _capacity / 2, _capacity), _main)
+
+                # mean preserving rounding of both charges to their two closest levels
+                for _t, ((_m, _wm), (_b, _wb)) in enumerate((_mm, _bb) for _mm in self.__round(_levels, _next_main)
+                                                            for _bb in self.__round(_levels, _next_backup)):
+                    targets[_l, int(_c), :, _t] = (_next_on_main * _n + _m) * _n + _b
+                    weights[_l, int(_c), :, _t] = _wm * _wb
+
+        _order = np.argsort(-weights, axis=3, kind="stable")
+        return np.take_along_axis(targets, _order, axis=3), np.take_along_axis(weights, _order, axis=3), satisfaction
+
+    def __forward_numpy(self, distribution, group_charge, targets, weights, satisfaction,
+                        probabilities, seasons, bot_activity, first_transition, transitions) -> float:
+        """
+        NumPy version of _forward_hours, vectorized over the joint states.
+        """
+        _groups, _levels, _batteries = distribution.shape
+        satisfied = 0.0
+
+        def _push(mass, load, charge):
+            _rows = np.arange(len(mass))[:, None, None] * _batteries
+            return np.bincount((_rows + targets[load, charge][None]).reshape(-1),
+                               (mass[:, :, None] * weights[load, charge][None]).reshape(-1),
+                               len(mass) * _batteries).reshape(mass.shape)
+
+        for h, (season, _bot_activity) in enumerate(zip(seasons.tolist(), bot_activity.tolist())):
+            _active = distribution * probabilities[h][None, :, None]
+            _passive = distribution - _active
+            satisfied += float((_active * satisfaction[1]).sum() + (_passive * satisfaction[0]).sum())
+
+            moved = np.zeros_like(distribution)
+            for _c in (0, 1):
+                _rows = group_charge == _c
+                if not _rows.any():
+                    continue
+                _shape = (-1, _batteries)
+                moved[_rows, 0] += _push(_active[_rows].sum(axis=1), 1, _c)
+                _passive_moved = _push(_passive[_rows].reshape(_shape), 0, _c).reshape(_passive[_rows].shape)
+                if _bot_activity:
+                    moved[np.ix_(_rows, np.arange(1, _levels))] += _passive_moved[:, :-1]
+                    moved[_rows, -1] += _passive_moved[:, -1]
+                else:
+                    moved[_rows] += _passive_moved
+
+            _transition = first_transition if h == 0 else transitions[season]
+            distribution = np.tensordot(_transition, moved, axes=([0], [0]))
+
+        return satisfied
+
+    def __group_transitions(self, season: int, groups: np.ndarray, group_number: int) -> np.ndarray:
+        """
+        Transition matrix between solar groups, states being weighted by the
+        stationary distribution of the season.
+
+        Args:
+            season (int): season index
+            groups (np.ndarray): group of each solar state
+            group_number (int): number of groups
+
+        Returns:
+            np.ndarray: transition matrix of shape (group_number, group_number)
+        """
+        if season not in self.__stationary:
+            # a sampled state moves on from the row of its value
+            self.__stationary[season] = stationary_distribution(self.__transitions, season, self.__rows)
+        _pi = self.__stationary[season]
+
+        # flows out of each group, pushed as one distribution
+        _flows = np.zeros((group_number, group_number))
+        for _group in range(group_number):
+            _mass = np.bincount(self.__rows, np.where(groups == _group, _pi, 0.0), self.solar_activity.N)
+            _flows[_group] = np.bincount(groups, self.__transitions.push(season, _mass), group_number)
+        return _flows / np.maximum(_flows.sum(axis=1, keepdims=True), 1e-300)
+
+    @staticmethod
+    def __round(levels: np.ndarray, charges: np.ndarray) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Args:
+            levels (np.ndarray): increasing battery levels
+            charges (np.ndarray): battery charges
+
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: lower and upper level indices with their weights
+        """
+        _lower = np.clip(np.searchsorted(levels, charges, side="right") - 1, 0, len(levels) - 2)
+        _fraction = np.clip((charges - levels[_lower]) / (levels[_lower + 1] - levels[_lower]), 0.0, 1.0)
+        return [(_lower, 1.0 - _fraction), (_lower + 1, _fraction)]
@@ -0,0 +1,195 @@
+import numpy as np
+from typing import Iterator, List, Tuple
+from const import ACTIVE_CURRENT, PASSIVE_CURRENT
+from solar_activity import SolarActivity
+from power_system import PowerSystem, PowerSystemBank
+from bot import Bot
+from timer import get_calendar
+
+
+def searchsorted_rows(cdf: np.ndarray, rows: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Vectorized np.searchsorted (left side) of values[e] in cdf[rows[e]] for
+    every trajectory e, done as a bisection over all trajectories at once.
+    Results are clipped to the last state like SolarActivity does.
+
+    Args:
+        cdf (np.ndarray): cumulative transition table of shape (N, N)
+        rows (np.ndarray): row of each trajectory
+        values (np.ndarray): uniform draw of each trajectory
+
+    Returns:
+        np.ndarray: new state index of each trajectory
+    """
+    n = cdf.shape[1]
+    lo = np.zeros(len(rows), dtype=np.intp)
+    hi = np.full(len(rows), n, dtype=np.intp)
+
+    for _ in range(n.bit_length()):
+        mid = (lo + hi) // 2
+        _open = lo < hi
+        _below = cdf[rows, np.minimum(mid, n - 1)] < values
+        lo = np.where(_open & _below, mid + 1, lo)
+        hi = np.where(_open & ~_below, mid, hi)
+
+    return np.minimum(lo, n - 1)
+
+
+class BatchSimulation():
+    """
+    This class allows to simulate many independent years (epochs) in lock-step.
+    Solar state, bot activation probability and battery states of every trajectory
+    are kept in NumPy arrays and advanced with one vectorized update per step
+    (steps of the solar activity model, one hour by default), following the same
+    rules as SolarActivity, Bot and PowerSystem.
+    Trajectories start from the current state of the given solar activity and bot,
+    which are not modified, at the beginning of a transition of the solar model
+    (solar states are held during transition_minutes // step_minutes steps).
+    Every epoch starts from that state: the serial engine, like the original
+    simulation loop, carries the solar state and bot probability reached at the
+    end of a year into the next one, while epochs here are independent, so that
+    they can be advanced together. Only the first year of the two engines follows
+    the same process; later years differ by their starting state.
+    Sparse solar activity models are sampled without expanding their transition
+    matrices, and the alias sampler is honoured.
+
+    Attributes:
+        solar_activity (SolarActivity): fitted solar activity model
+        bot (Bot): bot parameters
+        power_systems (List[PowerSystem]): simulated power systems
+        step_hours (float): step length in hours
+        seasons (np.ndarray): season index of each simulated step
+        bot_activity (np.ndarray): bot activity mask of each simulated step
+    """
+
+    def __init__(self,
+                 solar_activity: SolarActivity,
+                 bot: Bot,
+                 power_systems: List[PowerSystem]) -> None:
+        """
+        Prepares the per-state and per-system parameter arrays.
+
+        Args:
+            solar_activity (SolarActivity): fitted solar activity model
+            bot (Bot): bot parameters
+            power_systems (List[PowerSystem]): simulated power systems
+        """
+        self.solar_activity = solar_activity
+        self.bot = bot
+        self.power_systems = power_systems
+
+        _calendar = get_calendar(solar_activity.step_minutes)
+        assert bot.step_hours == _calendar.step_hours, "the bot and the solar activity steps differ"
+        self.step_hours = _calendar.step_hours
+        self.seasons = _calendar.seasons[_calendar.active_months]
+        self.bot_activity = _calendar.bot_activity[_calendar.active_months]
+
+        _values = [solar_activity.state_value(i) for i in range(solar_activity.N)]
+        # irradiance and sampling row of each state, rows go through the same
+        # value -> index conversion as SolarActivity
+        self.__irradiances = np.array([_v[1] for _v in _values])
+        self.__rows = np.array([solar_activity.state_index(_v) for _v in _values])
+
+        self.__dp = np.array([bot.dpw, bot.dpsp, bot.dps, bot.dpf]) * self.step_hours # per step
+
+    def run(self, epochs: int, rng: np.random.Generator = None) -> List[List[int]]:
+        """
+        Simulates epochs independent years.
+
+        Args:
+            epochs (int): number of simulated years
+            rng (np.random.Generator, optional): random generator. Defaults to a fresh one.
+
+        Returns:
+            List[List[int]]: [satisfied steps, simulated steps] of each power system
+        """
+        total = epochs * len(self.seasons)
+        return [[int(_satisfied), total] for _satisfied in self.run_per_epoch(epochs, rng).sum(axis=1)]
+
+    def run_per_epoch(self, epochs: int, rng: np.random.Generator = None) -> np.ndarray:
+        """
+        Simulates epochs independent years and keeps the result of each year.
+
+        Args:
+            epochs (int): number of simulated years
+            rng (np.random.Generator, optional): random generator. Defaults to a fresh one.
+
+        Returns:
+            np.ndarray: satisfied steps of shape (M, epochs), out of len(seasons) simulated steps
+        """
+        bank = PowerSystemBank.from_power_systems(self.power_systems, trajectories=epochs,
+                                                  step_hours=self.step_hours)
+        satisfied = np.zeros((len(bank), epochs), dtype=np.int64)
+
+        for _, irradiance, _is_active in self.sample_steps(epochs, rng):
+            satisfied += bank.next_step(np.where(_is_active, ACTIVE_CURRENT, PASSIVE_CURRENT), irradiance)
+
+        return satisfied
+
+    def sample_steps(self, epochs: int,
+                     rng: np.random.Generator = None,
+                     uniforms: np.ndarray = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Samples the solar states and bot activations of epochs independent years,
+        step by step. Each step draws the solar uniforms of every trajectory, when
+        the solar state transits after it, then the bot ones, unless pre-drawn
+        uniforms are given (the solar ones of the other steps are then unused).
+
+        Args:
+            epochs (int): number of simulated years
+            rng (np.random.Generator, optional): random generator. Defaults to a fresh one.
+            uniforms (np.ndarray, optional): solar ([e, s, 0]) and bot ([e, s, 1]) draws of
+            step s of epoch e, of shape (epochs, len(seasons), 2). Defaults to draws of rng.
+
+        Yields:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: index of the solar state used in the
+            step, its irradiance and the bot activation of each trajectory
+        """
+        if rng is None and uniforms is None:
+            rng = np.random.default_rng()
+
+        _sa = self.solar_activity
+        state = np.full(epochs, _sa.state_index(_sa.current_state))
+        irradiance = np.full(epochs, float(_sa.current_state[1]))
+        row = state.copy()
+        probability = np.full(epochs, self.bot.probability)
+        active_steps_left = np.full(epochs, self.bot.active_steps_left)
+        _held_steps = _sa.transition_minutes // _sa.step_minutes
+
+        for _step, (season, _bot_activity) in enumerate(zip(self.seasons.tolist(), self.bot_activity.tolist())):
+            _transits = (_step + 1) % _held_steps == 0
+            if uniforms is None:
+                _solar_draws = rng.random(epochs) if _transits else None
+                _bot_draws = rng.random(epochs)
+            else:
+                _solar_draws, _bot_draws = uniforms[:, _step, 0], uniforms[:, _step, 1]
+
+            # solar activity: current state is used this step, then transits
+            if not _transits:
+                _state = state
+            elif _sa.transitions is not None:
+                _state = _sa.transitions.sample_many(season, row, _solar_draws)
+            elif _sa.sampler == "alias":
+                _state = _sa.alias_tables.sample_many(season, row, _solar_draws)
+            else:
+                _state = searchsorted_rows(_sa.cdf_tables[season], row, _solar_draws)
+
+            # bot
+            if self.step_hours != 1.0:
+                _is_active = _bot_draws <= 1.0 - (1.0 - probability) ** self.step_hours
+            else:
+                _is_active = _bot_draws <= probability
+            if self.bot.activity_steps > 1: # an activation lasts one hour, activity_steps steps
+                active_steps_left = np.where((active_steps_left == 0) & _is_active, self.bot.activity_steps,
+                                             active_steps_left)
+                _is_active = active_steps_left > 0
+                active_steps_left -= _is_active
+            if _bot_activity:
+                probability = np.minimum(probability + self.__dp[season], 1.0)
+            probability = np.where(_is_active, self.bot.initial_probability, probability)
+
+            yield state, irradiance, _is_active
+
+            state = _state
+            irradiance = self.__irradiances[_state]
+            row = self.__rows[_state]
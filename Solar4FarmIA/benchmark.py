@@ -0,0 +1,227 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from typing import Callable, Dict, List
+from const import BOT_PARAMETERS, ACTIVE_MONTHS_BEGINNING, ACTIVE_CURRENT, PASSIVE_CURRENT
+from solar_activity import SolarActivity
+from power_system import PowerSystem
+from bot import Bot
+from simulation import ENGINES, simulate, panel_power_systems, surface_power_systems
+from timer import get_calendar
+
+
+BASELINE_FILE = "benchmark_baseline.json" # default baseline file
+MAX_SLOWDOWN = 0.25 # tolerated relative slowdown before a benchmark fails
+DATASET_YEARS = (1, 10, 50) # sizes of the synthetic datasets
+SYSTEM_NUMBERS = (1, 17, 500) # sizes of the end-to-end scenarios
+STEP_LENGTHS = (60, 15) # step lengths (minutes) of the step throughput benchmark
+
+# metadata rows of the synthetic NSRDB files, see data/solar_data.csv
+NSRDB_HEADER = ("Source,Location ID,City,State,Country,Latitude,Longitude,Time Zone,Elevation\n"
+                "NSRDB,0,-,-,-,48.61,2.42,0,84\n"
+                "Year,Month,Day,Hour,Minute,DNI,Temperature,DHI\n")
+
+
+def synthetic_nsrdb(solar_dataset: str, years: int, seed: int = 0, step_minutes: int = 60) -> None:
+    """
+    Writes a synthetic NSRDB csv file with a row every step_minutes (hourly rows by
+    default): temperature follows seasonal and daily cycles and the irradiance is
+    positive during the day only.
+
+    Args:
+        solar_dataset (str): written file
+        years (int): number of years of data
+        seed (int, optional): random seed. Defaults to 0.
+        step_minutes (int, optional): minutes between two rows. Defaults to 60.
+    """
+    rng = np.random.default_rng(seed)
+    _days = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+    _minutes = np.arange(0, 365 * 24 * 60, step_minutes)
+    _hours = _minutes / 60
+    _months = np.searchsorted(_days, _minutes // (24 * 60), side="right")
+    _seasonal = np.cos(2 * np.pi * (_hours / (365 * 24) - 0.55))
+    _daily = np.sin(np.pi * ((_hours % 24) - 6) / 12)
+
+    with open(solar_dataset, "w") as f:
+        f.write(NSRDB_HEADER)
+        for _year in range(years):
+            _temperature = 12 + 9 * _seasonal + 4 * _daily + rng.normal(0.0, 2.0, len(_hours))
+            _irradiance = np.maximum(0.0, _daily) * (600 + 250 * _seasonal) * rng.uniform(0.2, 1.0, len(_hours))
+            _rows = np.column_stack([np.full(len(_hours), 2000 + _year), _months, _minutes // (24 * 60) + 1,
+                                     (_minutes // 60) % 24, _minutes % 60,
+                                     np.round(_irradiance), np.round(_temperature, 1), np.zeros(len(_hours))])
+            np.savetxt(f, _rows, delimiter=",", fmt="%g")
+
+
+def best_time(function: Callable[[], None], repeat: int) -> float:
+    """
+    Args:
+        function (Callable[[], None]): measured function
+        repeat (int): number of measures
+
+    Returns:
+        float: shortest duration of the function in seconds
+    """
+    _durations = []
+    for _ in range(repeat):
+        _start = time.perf_counter()
+        function()
+        _durations.append(time.perf_counter() - _start)
+    return min(_durations)
+
+
+def scenario_systems(scenario: str, systems: int) -> List[PowerSystem]:
+    """
+    Builds systems power systems of the panel scenario (catalog panels repeated)
+    or of the surface scenario (surfaces evenly spread between 3 and 19 m^2).
+
+    Args:
+        scenario (str): "panel" or "surface"
+        systems (int): number of power systems
+
+    Returns:
+        List[PowerSystem]: power systems of the scenario
+    """
+    if scenario == "panel":
+        return list(itertools.islice(itertools.cycle(panel_power_systems("data/solar_panel.csv")), systems))
+    return surface_power_systems(np.linspace(3, 19, systems).tolist())
+
+
+def run_benchmarks(epochs: int = 100, engine: str = "batch", repeat: int = 3, quick: bool = False) -> Dict[str, float]:
+    """
+    Runs every benchmark. Results are rates, the higher the better: rows/s of the
+    transition matrices fit on synthetic datasets, hours/s of the next_step methods,
+    epochs/s of the panel and surface scenarios and steps/s of the surface scenario
+    for each step length (the fused engine is replaced by the batch one below an hour).
+
+    Args:
+        epochs (int, optional): simulated years of the scenarios. Defaults to 100.
+        engine (str, optional): simulation engine of the scenarios. Defaults to "batch".
+        repeat (int, optional): number of measures of each benchmark. Defaults to 3.
+        quick (bool, optional): only run the smallest sizes. Defaults to False.
+
+    Returns:
+        Dict[str, float]: rate of each benchmark
+    """
+    results = {}
+    _years = DATASET_YEARS[:1] if quick else DATASET_YEARS
+    _systems = SYSTEM_NUMBERS[:2] if quick else SYSTEM_NUMBERS
+
+    with tempfile.TemporaryDirectory() as _folder:
+        for _y in _years:
+            _dataset = os.path.join(_folder, f"nsrdb_{_y}.csv")
+            synthetic_nsrdb(_dataset, _y)
+            _duration = best_time(lambda: SolarActivity(initial_state=(0.0, 0.0), solar_dataset=_dataset), repeat)
+            results[f"fit_{_y}y_rows_per_s"] = _y * 365 * 24 / _duration
+
+    solar_activity = SolarActivity(initial_state=(0.0, 0.0), solar_dataset="data/solar_data.csv")
+    bot = Bot(**BOT_PARAMETERS)
+    power_system = PowerSystem(solar_area=3, solar_efficiency=0.2, production_country="France",
+                               max_power=600, material="Monosillicium")
+    _hours = 10000
+    _solar_state = (20.0, 500.0)
+
+    def _solar():
+        for _ in range(_hours):
+            solar_activity.next_step(ACTIVE_MONTHS_BEGINNING)
+
+    def _bot():
+        for _h in range(_hours):
+            bot.next_step(_h % 24, ACTIVE_MONTHS_BEGINNING)
+
+    def _power_system():
+        power_system.reset()
+        for _h in range(_hours):
+            power_system.next_step(ACTIVE_CURRENT if _h % 10 == 0 else PASSIVE_CURRENT, _solar_state)
+
+    results["solar_next_step_hours_per_s"] = _hours / best_time(_solar, repeat)
+    results["bot_next_step_hours_per_s"] = _hours / best_time(_bot, repeat)
+    results["power_system_next_step_hours_per_s"] = _hours / best_time(_power_system, repeat)
+
+    for _scenario, _m in itertools.product(("panel", "surface"), _systems):
+        _power_systems = scenario_systems(_scenario, _m)
+        _duration = best_time(lambda: simulate(_power_systems, solar_activity, epochs=epochs, engine=engine, seed=0),
+                              repeat)
+        results[f"{_scenario}_{_m}_epochs_per_s"] = epochs / _duration
+
+    _power_systems = scenario_systems("surface", SYSTEM_NUMBERS[1])
+    for _minutes in STEP_LENGTHS:
+        _model = SolarActivity(initial_state=(0.0, 0.0), solar_dataset="data/solar_data.csv", step_minutes=_minutes)
+        _engine = "batch" if engine == "fused" and _minutes != 60 else engine
+        _duration = best_time(lambda: simulate(_power_systems, _model, epochs=epochs, engine=_engine, seed=0),
+                              repeat)
+        results[f"step_{_minutes}min_steps_per_s"] = epochs * len(get_calendar(_minutes).active_steps) / _duration
+
+    return results
+
+
+def compare_baseline(results: Dict[str, float],
+                     baseline: Dict[str, float],
+                     max_slowdown: float = MAX_SLOWDOWN) -> List[str]:
+    """
+    Finds the benchmarks slower than their baseline by more than max_slowdown.
+
+    Args:
+        results (Dict[str, float]): measured rates
+        baseline (Dict[str, float]): baseline rates
+        max_slowdown (float, optional): tolerated relative slowdown. Defaults to MAX_SLOWDOWN.
+
+    Returns:
+        List[str]: names of the regressed benchmarks
+    """
+    return [_name for _name, _rate in results.items()
+            if _name in baseline and _rate < baseline[_name] * (1.0 - max_slowdown)]
+
+
+def main(argv: List[str] = None) -> int:
+    """
+    Runs the benchmarks, prints their rates next to the baseline ones and either
+    saves them as the new baseline or checks them against it.
+
+    Args:
+        argv (List[str], optional): command line arguments. Defaults to sys.argv[1:].
+
+    Returns:
+        int: exit code, 1 when a benchmark regressed
+    """
+    parser = argparse.ArgumentParser(description="Solar4FarmIA benchmarks")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline json file")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--max-slowdown", type=float, default=MAX_SLOWDOWN,
+                        help="tolerated relative slowdown, e.g. 0.25 for 25%%")
+    parser.add_argument("--epochs", type=int, default=100, help="simulated years of the scenarios")
+    parser.add_argument("--engine", choices=ENGINES, default="batch", help="simulation engine of the scenarios")
+    parser.add_argument("--repeat", type=int, default=3, help="number of measures of each benchmark")
+    parser.add_argument("--quick", action="store_true", help="only run the smallest sizes")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    results = run_benchmarks(args.epochs, args.engine, args.repeat, args.quick)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    for _name, _rate in results.items():
+        _reference = f"{baseline[_name]:14.1f}" if _name in baseline else f"{'-':>14}"
+        print(f"{_name:40} {_rate:14.1f} {_reference}")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        return 0
+
+    _regressions = compare_baseline(results, baseline, args.max_slowdown)
+    for _name in _regressions:
+        print(f"Regression: {_name} is more than {100 * args.max_slowdown:.0f}% slower than its baseline",
+              file=sys.stderr)
+    return 1 if _regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,6 +18,10 @@ class Bot():
             dp_spring (float): spring's probabilty discrete step
             dp_summer (float): summer's probabilty discrete step
             dp_fall (float): fall's probabilty discrete step
+            rng (np.random.Generator): random generator used for activation
+            step_hours (float): step length in hours
+            activity_steps (int): number of steps of an activation, one hour long
+            active_steps_left (int): remaining steps of the current activation
     """
 
     def __init__(self, 
@@ -25,11 +29,16 @@ class Bot():
                  dp_winter: float, 
                  dp_spring: float, 
                  dp_summer: float,
-                 dp_fall: float) -> None:
+                 dp_fall: float,
+                 rng: np.random.Generator = None,
+                 step_hours: float = 1.0) -> None:
         """
         Allows to initialize activation probabilty and probabilities
         discrete steps for each season. Keep initial probabilty in the 
-        interval [0.001, 0.01] and discrete steps in the interval [0.01, 0.05]
+        interval [0.001, 0.01] and discrete steps in the interval [0.01, 0.05].
+        Probabilities are hourly: with shorter steps, the probability grows by
+        dp * step_hours per step and activates with 1 - (1 - p) ** step_hours,
+        and an activation lasts one hour (activity_steps steps).
 
         Args:
             initial_probability (float): probability after activity
@@ -37,6 +46,9 @@ class Bot():
             dp_spring (float): spring's probabilty discrete step
             dp_summer (float): summer's probabilty discrete step
             dp_fall (float): fall's probabilty discrete step
+            rng (np.random.Generator, optional): random generator. Defaults to
+            the global numpy.random state.
+            step_hours (float, optional): step length in hours. Defaults to 1.0.
         """
         
         assert(0.0 <= initial_probability <= 1.0)
@@ -49,10 +61,15 @@ class Bot():
         self.dps = dp_summer
         self.dpf = dp_fall
 
+        self.rng = rng if rng is not None else np.random
+        self.step_hours = step_hours
+        self.activity_steps = max(1, round(1.0 / step_hours))
+        self.active_steps_left = 0
+
     def next_step(self, hour: int, month: int) -> float:
         """
         This function allows to simulate the behaviour of FarmBot for
-        each hour and month. It progressively increases the probability
+        each step and month. It progressively increases the probability
         of activation and resets the probability after its activation.
 
         Args:
@@ -63,22 +80,26 @@ class Bot():
             float: Electrical power used by bot (passive or active state)
         """
         _p = self.probability
-        _x = np.random.uniform(0.0, 1.0)
-        _is_active = (0.0 <= _x <= _p) # probabilistic activation
+        if self.step_hours != 1.0:
+            _p = 1.0 - (1.0 - _p) ** self.step_hours
+        _x = self.rng.uniform(0.0, 1.0)
+        if self.active_steps_left == 0 and (0.0 <= _x <= _p): # probabilistic activation
+            self.active_steps_left = self.activity_steps
 
-        if _is_active:
+        if self.active_steps_left > 0:
+            self.active_steps_left -= 1
             self.probability = self.initial_probability
             return ACTIVE_CURRENT
         else:
             if BOT_ACTIVITY_BEGINNING <= hour <= BOT_ACTIVITY_FINISHING:
                 if month == 12 or 1 <= month <= 2:
-                    self.probability += self.dpw
+                    self.probability += self.dpw * self.step_hours
                 elif 3 <= month <= 5:
-                    self.probability += self.dpsp
+                    self.probability += self.dpsp * self.step_hours
                 elif 6 <= month <= 8:
-                    self.probability += self.dps
+                    self.probability += self.dps * self.step_hours
                 elif 9 <= month <= 11:
-                    self.probability += self.dpf
+                    self.probability += self.dpf * self.step_hours
                 else:
                     print("Error in bot simulation: month number {month} does not exist")
                     sys.exit(1)
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+from typing import List
+from const import *
+from power_system import PowerSystem, PowerSystemBank
+
+
+CATALOG_COLUMNS = ("Area", "Efficiency", "Origin", "Power", "Material") # columns used by the simulation
+
+
+class PanelCatalog():
+    """
+    Solar panel catalog stored as struct-of-arrays. Battery capacities, thresholds
+    and carbon footprints of every panel are computed with column operations, like
+    PowerSystem does for a single panel. Origins and materials are categorical, their
+    codes index the footprint tables of const.py, and unknown values are reported
+    for the whole catalog before anything is simulated.
+
+        catalog = PanelCatalog.read("data/solar_panel.csv")
+        bank = catalog.bank(trajectories=epochs)
+
+    Attributes:
+        solar_area (np.ndarray): solar panel area of each panel
+        solar_efficiency (np.ndarray): solar panel efficiency of each panel
+        max_power (np.ndarray): solar panel maximal power of each panel
+        origin (pd.Categorical): production country of each panel
+        material (pd.Categorical): material of each panel
+        max_battery_capacity (np.ndarray): battery capacity of each panel
+        low_threshold (np.ndarray): discharge threshold of each panel
+        high_threshold (np.ndarray): charge threshold of each panel
+        carbon_footprint (np.ndarray): carbon footprint of each panel and its batteries
+    """
+
+    def __init__(self, panels: pd.DataFrame) -> None:
+        """
+        Validates the catalog and computes the derived columns.
+
+        Args:
+            panels (pd.DataFrame): catalog with the CATALOG_COLUMNS columns
+
+        Raises:
+            ValueError: missing columns, missing values, unknown origins or materials,
+            or batteries too small for the active current
+        """
+        _missing = [_c for _c in CATALOG_COLUMNS if _c not in panels.columns]
+        if _missing:
+            raise ValueError(f"Missing catalog columns {_missing}")
+        _empty = panels.index[panels[list(CATALOG_COLUMNS)].isna().any(axis=1)]
+        if len(_empty):
+            raise ValueError(f"Missing values in catalog rows {_empty.tolist()}")
+
+        self.origin = self.__categorical(panels["Origin"], PRODUCTION_COUNTRY_TO_FOOTPRINT, "origins")
+        self.material = self.__categorical(panels["Material"], PRODUCTION_MATERIAL_TO_FOOTPRINT, "materials")
+
+        self.solar_area = panels["Area"].to_numpy(dtype=float)
+        self.solar_efficiency = panels["Efficiency"].to_numpy(dtype=float)
+        self.max_power = panels["Power"].to_numpy(dtype=float)
+
+        self.max_battery_capacity = np.minimum(CAPACITY_COEFFICIENT * (self.max_power / OPERATION_VOLTAGE), MAX_CAPACITY)
+        self.low_threshold = DISCHARGE_THRESHOLD * self.max_battery_capacity
+        self.high_threshold = CHARGE_THRESHOLD * self.max_battery_capacity
+        _small = panels.index[self.high_threshold <= ACTIVE_CURRENT]
+        if len(_small):
+            raise ValueError(f"Batteries too small for the active current in catalog rows {_small.tolist()}")
+
+        _country = np.array(list(PRODUCTION_COUNTRY_TO_FOOTPRINT.values()))[self.origin.codes]
+        _material = np.array(list(PRODUCTION_MATERIAL_TO_FOOTPRINT.values()))[self.material.codes]
+        _distance = np.array([PRODUCTION_COUNTRY_DISTANCE[_c] for _c in PRODUCTION_COUNTRY_TO_FOOTPRINT])[self.origin.codes]
+        self.carbon_footprint = (self.max_power * (_country + _material) / 2) + (_distance * KM_TO_CARBON_FOOTPRINT) \
+            + self.max_battery_capacity * ENERGY_TO_FOOTPRINT
+
+    @classmethod
+    def read(cls, solar_panel: str) -> "PanelCatalog":
+        """
+        Reads a solar panel csv file (see data/solar_panel.csv), only its used columns.
+
+        Args:
+            solar_panel (str): solar panel file
+
+        Returns:
+            PanelCatalog: catalog of the file
+        """
+        _columns = pd.read_csv(solar_panel, nrows=0).columns
+        _used = [_c for _c in _columns if _c.strip() in CATALOG_COLUMNS]
+        panels = pd.read_csv(solar_panel, usecols=_used,
+                             dtype={_c: "category" for _c in _used if _c.strip() in ("Origin", "Material")})
+        return cls(panels.rename(columns=str.strip))
+
+    def __len__(self) -> int:
+        return len(self.max_battery_capacity)
+
+    def bank(self, trajectories: int = None, step_hours: float = 1.0) -> PowerSystemBank:
+        """
+        Args:
+            trajectories (int, optional): number of independent trajectories. Defaults to None.
+            step_hours (float, optional): step length in hours. Defaults to 1.0.
+
+        Returns:
+            PowerSystemBank: bank of the catalog panels
+        """
+        return PowerSystemBank(self.solar_area, self.solar_efficiency, self.max_power,
+                               trajectories=trajectories, battery_capacity=self.max_battery_capacity,
+                               step_hours=step_hours)
+
+    def power_systems(self) -> List[PowerSystem]:
+        """
+        Returns:
+            List[PowerSystem]: power system of each panel
+        """
+        return [PowerSystem(solar_area=_area,
+                            solar_efficiency=_efficiency,
+                            production_country=_origin,
+                            max_power=_power,
+                            material=_material)
+                for _area, _efficiency, _origin, _power, _material in zip(self.solar_area.tolist(),
+                                                                          self.solar_efficiency.tolist(),
+                                                                          self.origin.tolist(),
+                                                                          self.max_power.tolist(),
+                                                                          self.material.tolist())]
+
+    @staticmethod
+    def __categorical(values: pd.Series, table: dict, name: str) -> pd.Categorical:
+        """
+        Encodes a column with the keys of a footprint table as categories.
+
+        Args:
+            values (pd.Series): column values
+            table (dict): footprint table of const.py
+            name (str): column description for errors
+
+        Raises:
+            ValueError: values missing from the table
+
+        Returns:
+            pd.Categorical: encoded column
+        """
+        _unknown = ~values.isin(list(table)).to_numpy()
+        if _unknown.any():
+            raise ValueError(f"Unknown {name} {sorted(set(values[_unknown].astype(str)))} "
+                             f"in catalog rows {values.index[_unknown].tolist()}, known {name} are {list(table)}")
+        return pd.Categorical(values).set_categories(list(table))
@@ -0,0 +1,227 @@
+import argparse
+import contextlib
+import os
+import sys
+import time
+import pandas as pd
+from typing import List
+from const import STEP_MINUTES
+from common_random_numbers import TRAJECTORY_FOLDER
+import model_cache
+from instrumentation import Instrumentation
+from scenarios import MODEL_STORE_SIZE, read_manifest, run_scenarios
+from simulation import ENGINES, simulate, simulate_adaptive, panel_power_systems, surface_power_systems
+from streaming import CHECKPOINT_EPOCHS, read_records, records_results, run_streaming
+
+
+OUTPUT_FORMATS = (".csv", ".json", ".parquet") # supported result files
+
+
+def write_results(results: pd.DataFrame, output: str) -> None:
+    """
+    Writes simulation results to a csv, json or parquet file according to its extension.
+
+    Args:
+        results (pd.DataFrame): simulation results
+        output (str): output file
+    """
+    _extension = os.path.splitext(output)[1].lower()
+    if _extension == ".csv":
+        results.to_csv(output, index=False)
+    elif _extension == ".json":
+        results.to_json(output, orient="records", indent=2)
+    elif _extension == ".parquet":
+        results.to_parquet(output, index=False)
+    else:
+        raise ValueError(f"Unknown output format {_extension}, use one of {OUTPUT_FORMATS}")
+
+
+def plot_panels(results: pd.DataFrame) -> None:
+    """
+    Plots user efficiency against carbon footprint of each panel.
+
+    Args:
+        results (pd.DataFrame): panel simulation results
+    """
+    import matplotlib.pyplot as plt # imported lazily, headless runs do not need it
+
+    plt.grid()
+    plt.xlabel("Carbon footprint (kgCO_2)")
+    plt.ylabel("User efficiency(%)")
+
+    for _, row in results.iterrows():
+        plt.plot(row["carbon_footprint"], row["user_efficiency"], marker="o", markersize=10)
+        plt.text(row["carbon_footprint"], row["user_efficiency"], str(int(row["system"])))
+
+    plt.show()
+
+
+def plot_surfaces(results: pd.DataFrame) -> None:
+    """
+    Plots carbon footprint, user efficiency and surface of each power system in 3D.
+
+    Args:
+        results (pd.DataFrame): surface simulation results
+    """
+    import matplotlib.pyplot as plt # imported lazily, headless runs do not need it
+
+    fig = plt.figure()
+    ax = fig.add_subplot(projection="3d")
+
+    ax.set_xlabel("Carbon footprint (kgCO_2)")
+    ax.set_ylabel("User efficiency(%)")
+    ax.set_zlabel("Surface m^2")
+
+    plt.plot(results["carbon_footprint"] / 100, results["user_efficiency"], results["solar_area"])
+
+    plt.show()
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """
+    Parses command line arguments.
+
+    Args:
+        argv (List[str]): command line arguments
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="FarmBot solar power system simulations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    panel = subparsers.add_parser("panel", help="solar panel comparison")
+    panel.add_argument("epochs", type=int, help="number of simulated years")
+    panel.add_argument("solar_data", help="NSRDB solar data file")
+    panel.add_argument("solar_panel", help="solar panel data file")
+
+    surface = subparsers.add_parser("surface", help="solar panel surface comparison")
+    surface.add_argument("epochs", type=int, help="number of simulated years")
+    surface.add_argument("solar_data", help="NSRDB solar data file")
+
+    scenario = subparsers.add_parser("scenarios", help="sites x panel catalogs x bots scenarios of a manifest")
+    scenario.add_argument("manifest", help="json scenario manifest")
+    scenario.add_argument("-o", "--output", required=True, help="result file, .parquet or .csv")
+    scenario.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    scenario.add_argument("--store-size", type=int, default=MODEL_STORE_SIZE,
+                          help="fitted models kept in memory by each worker")
+
+    for _subparser in (panel, surface):
+        _subparser.add_argument("-o", "--output", help=f"result file, one of {OUTPUT_FORMATS}")
+        _subparser.add_argument("--plot", action="store_true", help="plot the results")
+        _subparser.add_argument("--engine", choices=ENGINES, default="batch", help="simulation engine")
+        _subparser.add_argument("--seed", type=int, default=None, help="random seed")
+        _subparser.add_argument("--sampler", choices=("cdf", "alias"), default="cdf",
+                                help="solar transition sampling: cumulative tables or alias tables")
+        _subparser.add_argument("--workers", type=int, default=None,
+                                help="worker processes of the parallel engine, defaults to the cpu count")
+        _subparser.add_argument("--trajectories", default=None,
+                                help="trajectory cache of the common engine, which replays the solar and bot "
+                                     "trajectories of a seed so that runs of the same seed are paired, "
+                                     f"defaults to {TRAJECTORY_FOLDER}")
+        _subparser.add_argument("--step-minutes", type=int, default=STEP_MINUTES,
+                                help="simulation step length in minutes, the solar data is resampled "
+                                     "to it (the fused engine only simulates hourly steps)")
+        _subparser.add_argument("--ci-width", type=float, default=None,
+                                help="adaptive mode (batch engine): stop once every user efficiency confidence "
+                                     "interval is narrower than this width (%%), epochs becomes the maximum")
+        _subparser.add_argument("--confidence", type=float, default=0.95,
+                                help="confidence level of the adaptive mode intervals")
+        _subparser.add_argument("--stream", default=None,
+                                help="streaming mode: simulate like the batch engine by chunks of years, write "
+                                     "the records of every year to parquet parts of this folder with a checkpoint "
+                                     "per chunk, and resume from its last checkpoint when it exists")
+        _subparser.add_argument("--checkpoint-epochs", type=int, default=CHECKPOINT_EPOCHS,
+                                help="years of each chunk, between two checkpoints, of the streaming mode")
+        _subparser.add_argument("--profile", default=None,
+                                help="write stage timings and counters to this file, "
+                                     "json when it ends with .json, pstats otherwise")
+
+    args = parser.parse_args(argv)
+    if getattr(args, "ci_width", None) is not None:
+        if args.engine != "batch":
+            parser.error(f"--ci-width runs the batch engine, --engine {args.engine} cannot be used with it")
+        if args.workers is not None:
+            parser.error("--ci-width runs the batch engine, --workers cannot be used with it")
+    if getattr(args, "stream", None) is not None:
+        if args.engine != "batch":
+            parser.error(f"--stream simulates like the batch engine, --engine {args.engine} cannot be used with it")
+        for _option in ("workers", "ci_width", "trajectories"):
+            if getattr(args, _option) is not None:
+                parser.error(f"--stream cannot be used with --{_option.replace('_', '-')}")
+    if getattr(args, "step_minutes", None) is not None:
+        if args.step_minutes <= 0 or 60 % args.step_minutes != 0:
+            parser.error(f"--step-minutes {args.step_minutes} must divide the hour, e.g. 60, 30, 15 or 5")
+        if args.engine == "fused" and args.step_minutes != 60:
+            parser.error("the fused engine only simulates hourly steps, --step-minutes must be 60")
+    if args.command != "scenarios" and args.workers is None:
+        args.workers = os.cpu_count()
+    if args.command != "scenarios" and args.trajectories is None:
+        args.trajectories = TRAJECTORY_FOLDER
+    return args
+
+
+def main(argv: List[str] = None) -> None:
+    """
+    Runs the panel or surface comparison, or the scenarios of a manifest.
+    Results are written to the output file, or printed when there is none.
+
+    Args:
+        argv (List[str], optional): command line arguments. Defaults to sys.argv[1:].
+    """
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.command == "scenarios":
+        _start = time.perf_counter()
+        _rows = run_scenarios(read_manifest(args.manifest), args.output, args.workers, args.store_size)
+        print(f"Wrote {_rows} rows in {time.perf_counter() - _start:.2f} s", file=sys.stderr)
+        return
+
+    instrumentation = Instrumentation() if args.profile is not None else contextlib.nullcontext()
+    with instrumentation:
+        # looked up on the module, which instrumentation wraps
+        solar_activity = model_cache.load_solar_activity(initial_state=(0.0, 0.0), solar_dataset=args.solar_data,
+                                                         step_minutes=args.step_minutes)
+        solar_activity.sampler = args.sampler
+        if args.command == "panel":
+            power_systems = panel_power_systems(args.solar_panel)
+        else:
+            power_systems = surface_power_systems()
+
+        _start = time.perf_counter()
+        if args.stream is not None:
+            _epochs = run_streaming(power_systems, solar_activity, args.stream, args.epochs,
+                                    seed=args.seed, checkpoint_epochs=args.checkpoint_epochs)
+            results = records_results(power_systems, read_records(args.stream), solar_activity.step_minutes)
+        elif args.ci_width is None:
+            results = simulate(power_systems, solar_activity,
+                               epochs=args.epochs, engine=args.engine, seed=args.seed, workers=args.workers,
+                               trajectory_dir=args.trajectories)
+            _epochs = args.epochs
+        else:
+            results = simulate_adaptive(power_systems, solar_activity, target_width=args.ci_width,
+                                        confidence=args.confidence, max_epochs=args.epochs, seed=args.seed)
+            _epochs = results["epochs"].iloc[0]
+        print(f"Simulated {_epochs} epochs in {time.perf_counter() - _start:.2f} s", file=sys.stderr)
+
+    if args.profile is not None:
+        print(instrumentation.report(), file=sys.stderr)
+        if args.profile.lower().endswith(".json"):
+            instrumentation.to_json(args.profile)
+        else:
+            instrumentation.dump_stats(args.profile)
+
+    if args.output is not None:
+        write_results(results, args.output)
+    else:
+        print(results.to_string(index=False))
+
+    if args.plot:
+        if args.command == "panel":
+            plot_panels(results)
+        else:
+            plot_surfaces(results)
+
+
+if __name__ == "__main__":
+    main()
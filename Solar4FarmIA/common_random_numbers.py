@@ -0,0 +1,195 @@
+import hashlib
+import os
+import tempfile
+import numpy as np
+from typing import List
+from const import ACTIVE_CURRENT, PASSIVE_CURRENT
+from solar_activity import SolarActivity
+from power_system import PowerSystem, PowerSystemBank
+from bot import Bot
+from batch_simulation import BatchSimulation
+from model_cache import model_digest
+
+
+TRAJECTORY_VERSION = 1 # bump when the trajectory layout or sampling changes
+TRAJECTORY_FOLDER = ".trajectory_cache" # default trajectory cache folder
+CHUNK_EPOCHS = 256 # epochs sampled with one generator, and replayed at once
+
+
+def trajectory_key(solar_activity: SolarActivity, bot: Bot, seed: int) -> str:
+    """
+    Computes the key of the trajectories of a solar model, a bot and a seed: the
+    digest of the model (see model_digest) and its current state, the bot
+    parameters and state, and the seed.
+
+    Args:
+        solar_activity (SolarActivity): fitted solar activity model
+        bot (Bot): bot parameters and state
+        seed (int): random seed
+
+    Returns:
+        str: sha256 hex digest
+    """
+    _hash = hashlib.sha256(model_digest(solar_activity).encode())
+    _hash.update(repr((tuple(float(_v) for _v in solar_activity.current_state),
+                       bot.initial_probability, bot.dpw, bot.dpsp, bot.dps, bot.dpf, bot.probability,
+                       bot.active_steps_left, bot.step_hours, seed, TRAJECTORY_VERSION)).encode())
+    return _hash.hexdigest()
+
+
+class TrajectoryCache():
+    """
+    Common random numbers: solar and bot trajectories sampled once per seed and
+    replayed against any power systems. Trajectories are stored as a memory-mapped
+    .npy array of shape (epochs, steps) holding the solar state index used in each
+    simulated step and the bot activation (the bot current is ACTIVE_CURRENT or
+    PASSIVE_CURRENT). Power systems replayed against the same trajectories, in one
+    run or in later ones, see the same weather and bot activity, so the differences
+    between them converge with far fewer epochs than with independent runs.
+
+        cache = TrajectoryCache.load(solar_model, bot, epochs=1000, seed=0)
+        satisfied = cache.replay(power_systems)
+
+    Epochs are sampled by chunks of CHUNK_EPOCHS independent years, each with a
+    generator spawned from the seed and the chunk index (see BatchSimulation), so a
+    cache asked for more epochs keeps its first ones and only samples the new chunks.
+    The initial solar state is replayed as its discrete state.
+
+    Attributes:
+        path (str): trajectory file
+        trajectories (np.ndarray): memory-mapped (state, active) records of shape (epochs, steps)
+        irradiances (np.ndarray): irradiance of each solar state
+        step_hours (float): step length in hours
+    """
+
+    def __init__(self, path: str, irradiances: np.ndarray, step_hours: float) -> None:
+        """
+        Memory-maps an existing trajectory file.
+
+        Args:
+            path (str): trajectory file
+            irradiances (np.ndarray): irradiance of each solar state
+            step_hours (float): step length in hours
+        """
+        self.path = path
+        self.trajectories = np.load(path, mmap_mode="r")
+        self.irradiances = irradiances
+        self.step_hours = step_hours
+
+    @classmethod
+    def load(cls,
+             solar_activity: SolarActivity,
+             bot: Bot,
+             epochs: int,
+             seed: int,
+             cache_dir: str = TRAJECTORY_FOLDER) -> "TrajectoryCache":
+        """
+        Returns the trajectories of a solar model, a bot and a seed, with at least
+        epochs years. Missing years are sampled and appended to the cached ones,
+        and the file is replaced atomically. Given objects are not modified.
+
+        Args:
+            solar_activity (SolarActivity): fitted solar activity model
+            bot (Bot): bot parameters and state
+            epochs (int): number of needed years
+            seed (int): random seed
+            cache_dir (str, optional): cache folder. Defaults to TRAJECTORY_FOLDER.
+
+        Returns:
+            TrajectoryCache: trajectories of at least epochs years
+        """
+        if seed is None:
+            raise ValueError("Common random numbers need a seed")
+        os.makedirs(cache_dir, exist_ok=True)
+
+        simulation = BatchSimulation(solar_activity, bot, [])
+        _irradiances = np.array([solar_activity.state_value(i)[1] for i in range(solar_activity.N)])
+        path = os.path.join(cache_dir, f"trajectories-{trajectory_key(solar_activity, bot, seed)[:16]}.npy")
+
+        _cached = 0
+        if os.path.exists(path):
+            try:
+                _cached = np.load(path, mmap_mode="r").shape[0]
+            except (OSError, ValueError):
+                _cached = 0 # corrupted entry, sample again
+        if _cached >= epochs:
+            return cls(path, _irradiances, simulation.step_hours)
+
+        _epochs = -(-epochs // CHUNK_EPOCHS) * CHUNK_EPOCHS
+        _state_type = np.min_scalar_type(solar_activity.N - 1)
+        _dtype = np.dtype([("state", _state_type), ("active", np.bool_)])
+
+        _fd, _temporary = tempfile.mkstemp(dir=cache_dir, suffix=".npy")
+        os.close(_fd)
+        try:
+            trajectories = np.lib.format.open_memmap(_temporary, mode="w+", dtype=_dtype,
+                                                     shape=(_epochs, len(simulation.seasons)))
+            if _cached:
+                trajectories[:_cached] = np.load(path, mmap_mode="r")
+            for _start in range(_cached, _epochs, CHUNK_EPOCHS):
+                _rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(_start // CHUNK_EPOCHS,)))
+                _states = np.empty((len(simulation.seasons), CHUNK_EPOCHS), dtype=_state_type)
+                _active = np.empty((len(simulation.seasons), CHUNK_EPOCHS), dtype=np.bool_)
+                for _step, (_state, _, _is_active) in enumerate(simulation.sample_steps(CHUNK_EPOCHS, _rng)):
+                    _states[_step] = _state
+                    _active[_step] = _is_active
+                trajectories["state"][_start:_start + CHUNK_EPOCHS] = _states.T
+                trajectories["active"][_start:_start + CHUNK_EPOCHS] = _active.T
+            trajectories.flush()
+            del trajectories
+            os.replace(_temporary, path)
+        except BaseException:
+            os.remove(_temporary)
+            raise
+
+        return cls(path, _irradiances, simulation.step_hours)
+
+    def __len__(self) -> int:
+        return self.trajectories.shape[0]
+
+    def replay(self, power_systems: List[PowerSystem], epochs: int = None) -> np.ndarray:
+        """
+        Simulates power systems along the first epochs cached years, CHUNK_EPOCHS
+        years at once.
+
+        Args:
+            power_systems (List[PowerSystem]): simulated power systems
+            epochs (int, optional): number of replayed years. Defaults to every cached year.
+
+        Returns:
+            np.ndarray: satisfied steps of shape (M, epochs), out of the steps of a year
+        """
+        if epochs is None:
+            epochs = len(self)
+        assert epochs <= len(self), f"only {len(self)} years are cached"
+
+        satisfied = []
+        for _start in range(0, epochs, CHUNK_EPOCHS):
+            _chunk = self.trajectories[_start:min(_start + CHUNK_EPOCHS, epochs)]
+            # step-major copies, every step reads contiguous rows
+            _irradiances = self.irradiances[np.ascontiguousarray(_chunk["state"].T)]
+            _loads = np.where(np.ascontiguousarray(_chunk["active"].T), ACTIVE_CURRENT, PASSIVE_CURRENT)
+
+            bank = PowerSystemBank.from_power_systems(power_systems, trajectories=len(_chunk),
+                                                      step_hours=self.step_hours)
+            _satisfied = np.zeros((len(bank), len(_chunk)), dtype=np.int64)
+            for _load, _irradiance in zip(_loads, _irradiances):
+                _satisfied += bank.next_step(_load, _irradiance)
+            satisfied.append(_satisfied)
+
+        if not satisfied:
+            return np.zeros((len(power_systems), 0), dtype=np.int64)
+        return np.concatenate(satisfied, axis=1)
+
+    def run(self, power_systems: List[PowerSystem], epochs: int = None) -> List[List[int]]:
+        """
+        Args:
+            power_systems (List[PowerSystem]): simulated power systems
+            epochs (int, optional): number of replayed years. Defaults to every cached year.
+
+        Returns:
+            List[List[int]]: [satisfied steps, simulated steps] of each power system
+        """
+        _satisfied = self.replay(power_systems, epochs)
+        total = _satisfied.shape[1] * self.trajectories.shape[1]
+        return [[int(_s), total] for _s in _satisfied.sum(axis=1)]
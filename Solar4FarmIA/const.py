@@ -13,11 +13,31 @@ IRRADIANCE_STATE_NUMBER = 20 # number of discrete irradiance states
 BOT_ACTIVITY_BEGINNING = 6 # hour of bot activity beginning
 BOT_ACTIVITY_FINISHING = 20 # hour of bot activity ending
 
+STEP_MINUTES = 60 # default simulation step length in minutes
+
+# default FarmBot activation parameters (see Bot)
+BOT_PARAMETERS = {
+    "initial_probability": 0.005,
+    "dp_winter": 0.01,
+    "dp_spring": 0.03,
+    "dp_summer": 0.05,
+    "dp_fall": 0.02
+}
+
+ACTIVE_MONTHS_BEGINNING = 6 # first simulated month of the year
+ACTIVE_MONTHS_FINISHING = 8 # last simulated month of the year
+
 KM_TO_CARBON_FOOTPRINT = 1.1 # kgCO_2 eq km for a truck of 20 tonnes
 ENERGY_TO_FOOTPRINT = 0.175 * OPERATION_VOLTAGE # kgCO_2 eq Wh
 
 MONTHS_DAYS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31] # number of days per month
 
+SEASON_NUMBER = 4 # number of seasons
+WINTER, SPRING, SUMMER, FALL = 0, 1, 2, 3 # season indices
+# season index for each month (index 0 is not a month)
+MONTH_TO_SEASON = [-1, WINTER, WINTER, SPRING, SPRING, SPRING, SUMMER,
+                   SUMMER, SUMMER, FALL, FALL, FALL, WINTER]
+
 # kgCO_2 eq kWc for each country
 PRODUCTION_COUNTRY_TO_FOOTPRINT = {
     "France": 0.355,
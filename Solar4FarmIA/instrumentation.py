@@ -0,0 +1,257 @@
+import cProfile
+import contextlib
+import functools
+import json
+import marshal
+import time
+import numpy as np
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+import simulation
+import parallel_simulation
+import model_cache
+from solar_activity import SolarActivity
+from power_system import PowerSystem, PowerSystemBank
+from bot import Bot
+from batch_simulation import BatchSimulation
+from kernel import FusedSimulation
+from timer import get_calendar
+
+
+COUNTERS = ("samples_drawn", "battery_switches", "unmet_demand_hours", "simulated_hours", "epochs")
+
+
+class Instrumentation():
+    """
+    This class allows to measure where simulations spend their time. Inside its
+    context, the hot methods (model_cache.load_solar_activity, SolarActivity fit
+    and next_step, Bot.next_step, PowerSystem and PowerSystemBank next_step, and the
+    epoch loops of every engine) are replaced by timed wrappers which also count
+    drawn samples (one solar sample per transition, one bot sample per step),
+    battery switches and unmet-demand hours. A model load without a fit stage is a
+    cache hit. The original methods are restored on exit, so the hot
+    path is untouched when instrumentation is not active. Worker processes of the
+    parallel engine are not measured.
+
+        with Instrumentation() as instrumentation:
+            simulate(power_systems, solar_model, epochs=10, engine="serial")
+        instrumentation.to_json("profile.json")
+
+    Attributes:
+        calls (Dict[str, int]): number of calls of each stage
+        total_time (Dict[str, float]): time spent in each stage, nested stages included (s)
+        own_time (Dict[str, float]): time spent in each stage, nested stages excluded (s)
+        counters (Dict[str, int]): value of each counter of COUNTERS
+        profiler (cProfile.Profile): function level profiler, when requested
+    """
+
+    def __init__(self, profile: bool = False) -> None:
+        """
+        Args:
+            profile (bool, optional): also run cProfile inside the context. Defaults to False.
+        """
+        self.calls = {}
+        self.total_time = {}
+        self.own_time = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.profiler = cProfile.Profile() if profile else None
+
+        self.__locations = {}
+        self.__stack = []
+        self.__originals = []
+
+    def __enter__(self) -> "Instrumentation":
+        assert not self.__originals, "instrumentation is already active"
+
+        self.__wrap(model_cache, "load_solar_activity", "model.load")
+        self.__wrap(SolarActivity, "__init__", "solar_activity.fit")
+        self.__wrap(SolarActivity, "next_step", "solar_activity.next_step",
+                    before=lambda args: args[0].current_state, after=self.__count_solar_sample)
+        self.__wrap(Bot, "next_step", "bot.next_step", after=self.__count_bot_sample)
+        self.__wrap(PowerSystem, "next_step", "power_system.next_step",
+                    before=lambda args: args[0].on_main_battery, after=self.__count_power_system)
+        self.__wrap(PowerSystemBank, "next_step", "power_system_bank.next_step",
+                    before=lambda args: args[0].on_main_battery.copy(), after=self.__count_bank)
+        self.__wrap(BatchSimulation, "run_per_epoch", "epochs.batch", after=self.__count_batch)
+        self.__wrap(FusedSimulation, "run_uniforms", "epochs.fused", after=self.__count_fused)
+        for _module in (parallel_simulation, simulation):
+            self.__wrap(_module, "run_epochs", "epochs.serial", after=self.__count_serial)
+
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.profiler is not None:
+            self.profiler.disable()
+        for _owner, _attribute, _original in reversed(self.__originals):
+            setattr(_owner, _attribute, _original)
+        self.__originals = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Times a block of code as an additional stage.
+
+        Args:
+            name (str): stage name
+        """
+        self.__locations.setdefault(name, ("~", 0, name))
+        self.__stack.append(0.0)
+        _start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.__record(name, time.perf_counter() - _start)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Increments a counter.
+
+        Args:
+            name (str): counter name
+            value (int, optional): increment. Defaults to 1.
+        """
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: stages (calls, total and own time) and counters
+        """
+        return {
+            "stages": {_name: {"calls": self.calls[_name],
+                               "total_time": self.total_time[_name],
+                               "own_time": self.own_time[_name]} for _name in self.calls},
+            "counters": dict(self.counters)
+        }
+
+    def to_json(self, path: str) -> None:
+        """
+        Writes the stages and counters to a json file.
+
+        Args:
+            path (str): written file
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def dump_stats(self, path: str) -> None:
+        """
+        Writes a file readable by pstats.Stats (and tools such as snakeviz): the cProfile
+        statistics when profiling was requested, the stage statistics otherwise.
+
+        Args:
+            path (str): written file
+        """
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+            return
+
+        _stats = {}
+        for _name, _calls in self.calls.items():
+            _stats[self.__locations[_name]] = (_calls, _calls, self.own_time[_name], self.total_time[_name], {})
+        with open(path, "wb") as f:
+            marshal.dump(_stats, f)
+
+    def report(self) -> str:
+        """
+        Returns:
+            str: table of the stages by decreasing own time, followed by the counters
+        """
+        _lines = [f"{'stage':32} {'calls':>10} {'total (s)':>10} {'own (s)':>10}"]
+        for _name in sorted(self.calls, key=self.own_time.get, reverse=True):
+            _lines.append(f"{_name:32} {self.calls[_name]:10d} "
+                          f"{self.total_time[_name]:10.3f} {self.own_time[_name]:10.3f}")
+        for _name, _value in self.counters.items():
+            _lines.append(f"{_name:32} {_value:10d}")
+        return "\n".join(_lines)
+
+    def __wrap(self,
+               owner: Any,
+               attribute: str,
+               name: str,
+               before: Callable[[Tuple], Any] = None,
+               after: Callable[[Tuple, Any, Any], None] = None) -> None:
+        """
+        Replaces owner.attribute by a timed wrapper until the context exits.
+
+        Args:
+            owner (Any): class or module
+            attribute (str): wrapped function
+            name (str): stage name
+            before (Callable[[Tuple], Any], optional): called with the arguments before the call
+            after (Callable[[Tuple, Any, Any], None], optional): called with the arguments,
+            the result and the value returned by before after the call
+        """
+        _function = getattr(owner, attribute)
+        _code = _function.__code__
+        self.__locations[name] = (_code.co_filename, _code.co_firstlineno, name)
+
+        @functools.wraps(_function)
+        def _wrapper(*args, **kwargs):
+            _token = before(args) if before is not None else None
+            self.__stack.append(0.0)
+            _start = time.perf_counter()
+            try:
+                result = _function(*args, **kwargs)
+            finally:
+                self.__record(name, time.perf_counter() - _start)
+            if after is not None:
+                after(args, result, _token)
+            return result
+
+        self.__originals.append((owner, attribute, _function))
+        setattr(owner, attribute, _wrapper)
+
+    def __record(self, name: str, elapsed: float) -> None:
+        """
+        Closes a stage call opened by pushing on the stack.
+
+        Args:
+            name (str): stage name
+            elapsed (float): duration of the call (s)
+        """
+        _nested = self.__stack.pop()
+        if self.__stack:
+            self.__stack[-1] += elapsed
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.total_time[name] = self.total_time.get(name, 0.0) + elapsed
+        self.own_time[name] = self.own_time.get(name, 0.0) + elapsed - _nested
+
+    def __count_solar_sample(self, args: Tuple, result: Any, token: Any) -> None:
+        # a transition sets a new state tuple, held steps keep the same one
+        self.counters["samples_drawn"] += int(args[0].current_state is not token)
+
+    def __count_bot_sample(self, args: Tuple, result: Any, token: Any) -> None:
+        self.counters["samples_drawn"] += 1
+
+    def __count_power_system(self, args: Tuple, result: bool, token: bool) -> None:
+        self.counters["battery_switches"] += int(args[0].on_main_battery != token)
+        self.counters["unmet_demand_hours"] += int(not result)
+        self.counters["simulated_hours"] += 1
+
+    def __count_bank(self, args: Tuple, result: np.ndarray, token: np.ndarray) -> None:
+        self.counters["battery_switches"] += int(np.count_nonzero(args[0].on_main_battery != token))
+        self.counters["unmet_demand_hours"] += int(result.size - np.count_nonzero(result))
+        self.counters["simulated_hours"] += int(result.size)
+
+    def __count_serial(self, args: Tuple, result: List[List[int]], token: Any) -> None:
+        if result:
+            self.counters["epochs"] += result[0][1] // len(get_calendar(args[0].step_minutes).active_steps)
+
+    def __count_batch(self, args: Tuple, result: np.ndarray, token: Any) -> None:
+        # the bank of the batch engine is instrumented, only samples are left to count:
+        # a bot sample per step and a solar one per transition
+        _sa = args[0].solar_activity
+        _steps = len(args[0].seasons)
+        _transitions = _steps // (_sa.transition_minutes // _sa.step_minutes)
+        self.counters["samples_drawn"] += result.shape[1] * (_steps + _transitions)
+        self.counters["epochs"] += result.shape[1]
+
+    def __count_fused(self, args: Tuple, result: np.ndarray, token: Any) -> None:
+        _hours = result.shape[1] * len(args[0].seasons)
+        self.counters["samples_drawn"] += 2 * _hours
+        self.counters["epochs"] += result.shape[1]
+        if args[0].backend == "numba": # the numpy backend goes through the instrumented bank
+            self.counters["unmet_demand_hours"] += int(result.shape[0] * _hours - result.sum())
+            self.counters["simulated_hours"] += result.shape[0] * _hours
@@ -0,0 +1,241 @@
+import numpy as np
+from typing import List
+from const import ACTIVE_CURRENT, PASSIVE_CURRENT, OPERATION_VOLTAGE
+from solar_activity import SolarActivity
+from power_system import PowerSystem, PowerSystemBank
+from bot import Bot
+from batch_simulation import BatchSimulation
+from timer import get_calendar
+
+
+CHUNK_EPOCHS = 1024 # epochs whose random numbers are drawn at once
+
+_compiled_years = None # _fused_years compiled by numba, on first use
+
+
+def _fused_years(cdf_tables, irradiances, rows, seasons, bot_activity, dp,
+                 initial_probability, start_probability, start_row, start_irradiance,
+                 area, efficiency, capacity, low_threshold, high_threshold, uniforms):
+    """
+    Fused hour loop of SolarActivity, Bot and PowerSystem over whole years,
+    compiled by numba. uniforms[e, h] holds the solar and bot draws of hour h
+    of epoch e. Returns the satisfied hours of shape (M, epochs).
+    """
+    n = cdf_tables.shape[2]
+    m = area.shape[0]
+    epochs, hours = uniforms.shape[0], uniforms.shape[1]
+    satisfied = np.zeros((m, epochs), dtype=np.int64)
+    main = np.empty(m)
+    backup = np.empty(m)
+    on_main = np.empty(m, dtype=np.bool_)
+
+    for e in range(epochs):
+        row = start_row
+        irradiance = start_irradiance
+        probability = start_probability
+        for i in range(m):
+            main[i] = capacity[i]
+            backup[i] = capacity[i]
+            on_main[i] = True
+
+        for h in range(hours):
+            season = seasons[h]
+
+            # solar activity: binary search of the draw in the cumulative row
+            u = uniforms[e, h, 0]
+            lo = 0
+            hi = n
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if cdf_tables[season, row, mid] < u:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            state = min(lo, n - 1)
+
+            # bot
+            if uniforms[e, h, 1] <= probability:
+                load_current = ACTIVE_CURRENT
+                probability = initial_probability
+            else:
+                load_current = PASSIVE_CURRENT
+                if bot_activity[h]:
+                    probability = min(probability + dp[season], 1.0)
+
+            # power systems, see PowerSystem.next_step
+            for i in range(m):
+                solar_current = (irradiance * area[i]) * efficiency[i] / OPERATION_VOLTAGE
+                if on_main[i] and not (main[i] >= load_current and main[i] >= low_threshold[i]):
+                    on_main[i] = False
+                elif not on_main[i] and backup[i] < load_current and main[i] >= high_threshold[i]:
+                    on_main[i] = True
+
+                if on_main[i]:
+                    main[i] -= load_current
+                    if solar_current >= capacity[i] / 2:
+                        backup[i] = min(backup[i] + capacity[i] / 2, capacity[i])
+                    satisfied[i, e] += 1
+                elif backup[i] >= load_current:
+                    backup[i] -= load_current
+                    if solar_current >= capacity[i] / 2:
+                        main[i] = min(main[i] + capacity[i] / 2, capacity[i])
+                    satisfied[i, e] += 1
+
+            irradiance = irradiances[state]
+            row = rows[state]
+
+    return satisfied
+
+
+def compiled_kernel():
+    """
+    Compiles the fused kernel with numba on first call. numba is imported here
+    rather than with the module, as importing it takes most of a second.
+
+    Returns:
+        Callable: _fused_years compiled by numba, None when numba is not installed
+    """
+    global _compiled_years
+    if _compiled_years is None:
+        try:
+            import numba
+        except ImportError: # numba is optional, the NumPy backend is used otherwise
+            return None
+        _compiled_years = numba.njit(cache=True, nogil=True)(_fused_years)
+    return _compiled_years
+
+
+class FusedSimulation():
+    """
+    This class allows to simulate whole years with a single fused kernel running
+    SolarActivity transitions, Bot activation and PowerSystem batteries hour by hour
+    over preallocated arrays. The kernel is compiled with numba when it is installed;
+    otherwise a NumPy backend vectorized over epochs is used, which runs the steps of
+    BatchSimulation on the same draws. Both backends consume the same block of random
+    numbers, drawn from a numpy.random.Generator, and follow the reference classes
+    exactly for the same draws. The compiled kernel samples the cumulative tables of
+    dense models: sparse models and the alias sampler run the NumPy backend, so that
+    sparse models are not expanded and samplers give the reference transitions.
+
+    Attributes:
+        solar_activity (SolarActivity): fitted solar activity model
+        bot (Bot): bot parameters
+        power_systems (List[PowerSystem]): simulated power systems
+        backend (str): "numba" or "numpy", the backend that runs
+        seasons (np.ndarray): season index of each simulated hour
+        bot_activity (np.ndarray): bot activity mask of each simulated hour
+    """
+
+    def __init__(self,
+                 solar_activity: SolarActivity,
+                 bot: Bot,
+                 power_systems: List[PowerSystem],
+                 backend: str = None) -> None:
+        """
+        Prepares the arrays of the kernel.
+
+        Args:
+            solar_activity (SolarActivity): fitted solar activity model
+            bot (Bot): bot parameters
+            power_systems (List[PowerSystem]): simulated power systems
+            backend (str, optional): "numba" or "numpy". Defaults to numba when it is installed
+            and the model is dense with the cdf sampler, to numpy otherwise.
+
+        Raises:
+            ValueError: unknown backend, or numba asked for a sparse model or the alias sampler
+            ImportError: numba asked while it is not installed
+        """
+        _compilable = solar_activity.transitions is None and solar_activity.sampler == "cdf"
+        if backend is None:
+            backend = "numba" if _compilable and compiled_kernel() is not None else "numpy"
+        if backend not in ("numba", "numpy"):
+            raise ValueError(f"Unknown backend {backend}, use numba or numpy")
+        if backend == "numba" and not _compilable:
+            raise ValueError("The numba backend samples the cumulative tables of dense models, "
+                             "use the numpy backend for sparse models or the alias sampler")
+        if backend == "numba" and compiled_kernel() is None:
+            raise ImportError("numba is not installed, use the numpy backend")
+
+        self.solar_activity = solar_activity
+        self.bot = bot
+        self.power_systems = power_systems
+        self.backend = backend
+
+        assert solar_activity.step_minutes == 60 and bot.step_hours == 1.0, \
+            "the fused engine simulates hourly steps"
+        _calendar = get_calendar()
+        self.seasons = np.ascontiguousarray(_calendar.seasons[_calendar.active_months])
+        self.bot_activity = np.ascontiguousarray(_calendar.bot_activity[_calendar.active_months])
+
+        _values = [solar_activity.state_value(i) for i in range(solar_activity.N)]
+        self.__irradiances = np.array([_v[1] for _v in _values], dtype=float)
+        self.__rows = np.array([solar_activity.state_index(_v) for _v in _values], dtype=np.int64)
+        self.__dp = np.array([bot.dpw, bot.dpsp, bot.dps, bot.dpf], dtype=float)
+        self.__bank = PowerSystemBank.from_power_systems(power_systems)
+        self.__batch = BatchSimulation(solar_activity, bot, power_systems)
+
+    def run(self, epochs: int, rng: np.random.Generator = None) -> List[List[int]]:
+        """
+        Simulates epochs independent years.
+
+        Args:
+            epochs (int): number of simulated years
+            rng (np.random.Generator, optional): random generator. Defaults to a fresh one.
+
+        Returns:
+            List[List[int]]: [satisfied hours, simulated hours] of each power system
+        """
+        total = epochs * len(self.seasons)
+        return [[int(_satisfied), total] for _satisfied in self.run_per_epoch(epochs, rng).sum(axis=1)]
+
+    def run_per_epoch(self, epochs: int, rng: np.random.Generator = None) -> np.ndarray:
+        """
+        Simulates epochs independent years by chunks of CHUNK_EPOCHS epochs.
+
+        Args:
+            epochs (int): number of simulated years
+            rng (np.random.Generator, optional): random generator. Defaults to a fresh one.
+
+        Returns:
+            np.ndarray: satisfied hours of shape (M, epochs), out of len(seasons) simulated hours
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+
+        _chunks = []
+        for _start in range(0, epochs, CHUNK_EPOCHS):
+            _uniforms = rng.random((min(CHUNK_EPOCHS, epochs - _start), len(self.seasons), 2))
+            _chunks.append(self.run_uniforms(_uniforms))
+
+        if not _chunks:
+            return np.zeros((len(self.power_systems), 0), dtype=np.int64)
+        return np.concatenate(_chunks, axis=1)
+
+    def run_uniforms(self, uniforms: np.ndarray) -> np.ndarray:
+        """
+        Simulates one year per row of uniforms, whose [e, h, 0] and [e, h, 1] entries
+        are the solar and bot draws of hour h of epoch e.
+
+        Args:
+            uniforms (np.ndarray): uniform draws of shape (epochs, len(seasons), 2)
+
+        Returns:
+            np.ndarray: satisfied hours of shape (M, epochs)
+        """
+        _sa = self.solar_activity
+        if self.backend == "numba":
+            _bank = self.__bank
+            return compiled_kernel()(np.ascontiguousarray(_sa.cdf_tables), self.__irradiances, self.__rows,
+                                self.seasons, self.bot_activity, self.__dp,
+                                float(self.bot.initial_probability), float(self.bot.probability),
+                                _sa.state_index(_sa.current_state), float(_sa.current_state[1]),
+                                _bank.solar_area, _bank.solar_efficiency, _bank.max_battery_capacity,
+                                _bank.low_threshold, _bank.high_threshold, uniforms)
+
+        epochs = uniforms.shape[0]
+        bank = PowerSystemBank.from_power_systems(self.power_systems, trajectories=epochs)
+        satisfied = np.zeros((len(bank), epochs), dtype=np.int64)
+        for _, irradiance, _is_active in self.__batch.sample_steps(epochs, uniforms=uniforms):
+            satisfied += bank.next_step(np.where(_is_active, ACTIVE_CURRENT, PASSIVE_CURRENT), irradiance)
+
+        return satisfied
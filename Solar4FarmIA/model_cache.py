@@ -0,0 +1,293 @@
+import contextlib
+import glob
+import hashlib
+import os
+import struct
+import tempfile
+import zipfile
+import numpy as np
+from typing import Dict, Tuple
+from const import TEMPERATURE_STATE_NUMBER, IRRADIANCE_STATE_NUMBER, STEP_MINUTES
+from solar_activity import SolarActivity
+from solar_dataset import StepResampler, nsrdb_complete_size
+
+
+CACHE_VERSION = 5 # bump when the cached model layout changes
+CACHE_FOLDER = ".solar_cache" # cache folder, next to the solar dataset
+
+
+def dataset_hash(solar_dataset: str, size: int = None) -> str:
+    """
+    Computes the content hash of a solar dataset, reading it by blocks.
+
+    Args:
+        solar_dataset (str): solar dataset file
+        size (int, optional): number of hashed bytes. Defaults to the whole file.
+
+    Returns:
+        str: sha256 hex digest
+    """
+    _hash = hashlib.sha256()
+    _left = size if size is not None else np.inf
+    with open(solar_dataset, "rb") as f:
+        for _block in iter(lambda: f.read(int(min(1 << 20, _left))), b""):
+            _hash.update(_block)
+            _left -= len(_block)
+    return _hash.hexdigest()
+
+
+def fit_settings(step_minutes: int = STEP_MINUTES) -> str:
+    """
+    Describes what a fitted model depends on besides its dataset: the
+    discretization constants, the step length and the cache layout.
+
+    Args:
+        step_minutes (int, optional): step length of the model. Defaults to STEP_MINUTES.
+
+    Returns:
+        str: fit settings
+    """
+    return f"{TEMPERATURE_STATE_NUMBER}:{IRRADIANCE_STATE_NUMBER}:{step_minutes}:{CACHE_VERSION}"
+
+
+def cache_key(solar_dataset: str, step_minutes: int = STEP_MINUTES) -> str:
+    """
+    Computes the cache key of a fitted model: the dataset content hash,
+    the discretization constants and the step length.
+
+    Args:
+        solar_dataset (str): solar dataset file
+        step_minutes (int, optional): step length of the model. Defaults to STEP_MINUTES.
+
+    Returns:
+        str: cache key
+    """
+    _key = f"{dataset_hash(solar_dataset)}:{fit_settings(step_minutes)}"
+    return hashlib.sha256(_key.encode()).hexdigest()
+
+
+def model_digest(solar_activity: SolarActivity) -> str:
+    """
+    Computes the digest of what a model samples: its sampling tables, sampler,
+    step and transition lengths and bins (not its current state).
+
+    Args:
+        solar_activity (SolarActivity): fitted solar activity model
+
+    Returns:
+        str: sha256 hex digest
+    """
+    _hash = hashlib.sha256()
+    if solar_activity.transitions is not None:
+        _tables = (solar_activity.transitions.indptr, solar_activity.transitions.indices,
+                   solar_activity.transitions.cumulative)
+    else:
+        _tables = (solar_activity.cdf_tables,)
+    for _table in _tables:
+        _hash.update(np.ascontiguousarray(_table).tobytes())
+    _hash.update(repr((solar_activity.sampler, solar_activity.step_minutes, solar_activity.transition_minutes,
+                       solar_activity.Tmin, solar_activity.Tmax, solar_activity.Rmin, solar_activity.Rmax,
+                       solar_activity.N)).encode())
+    return _hash.hexdigest()
+
+
+def save_model(solar_activity: SolarActivity,
+               path: str,
+               key: str,
+               dataset_digest: str = "",
+               base_key: str = None) -> None:
+    """
+    Writes a fitted model to an uncompressed .npz file (so that it can be memory-mapped).
+    Besides the tables, the file keeps what updates need: the observed counts
+    as (code, count) pairs, the last counted row, the resampler position and the
+    size and hash of the fitted lines of the dataset.
+    The file is written next to its destination and moved atomically.
+
+    Args:
+        solar_activity (SolarActivity): fitted dense model
+        path (str): destination file
+        key (str): cache key of the model
+        dataset_digest (str, optional): hash of the fitted lines of the dataset. Defaults to "".
+        base_key (str, optional): cache key of the fit whose bins the model keeps. Defaults to key.
+    """
+    _bounds = np.array([solar_activity.Tmin, solar_activity.Tmax,
+                        solar_activity.Rmin, solar_activity.Rmax,
+                        solar_activity.dT, solar_activity.dR])
+    _counts = solar_activity.counts.reshape(-1)
+    _codes = np.flatnonzero(_counts)
+    _last = solar_activity.last_counted
+
+    _fd, _tmp = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(_fd, "wb") as f:
+            np.savez(f,
+                     key=np.array(key),
+                     base_key=np.array(base_key if base_key is not None else key),
+                     bounds=_bounds,
+                     step_minutes=np.array(solar_activity.step_minutes),
+                     transition_minutes=np.array(solar_activity.transition_minutes),
+                     settings=np.array(fit_settings(solar_activity.step_minutes)),
+                     transition_matrices=solar_activity.transition_matrices,
+                     cdf_tables=solar_activity.cdf_tables,
+                     count_codes=_codes,
+                     count_values=_counts[_codes],
+                     last_counted=np.array(_last if _last is not None else (-1, -1)),
+                     resampler=np.array([solar_activity.resampler.data_minutes,
+                                         solar_activity.resampler.position]),
+                     dataset_offset=np.array(solar_activity.dataset_offset),
+                     dataset_digest=np.array(dataset_digest))
+        os.replace(_tmp, path)
+    except BaseException:
+        os.remove(_tmp)
+        raise
+
+
+def memmap_npz(path: str) -> Dict[str, np.ndarray]:
+    """
+    Memory-maps the arrays of an uncompressed .npz file (np.load ignores
+    mmap_mode for archives). Compressed members are read in memory.
+
+    Args:
+        path (str): .npz file
+
+    Returns:
+        Dict[str, np.ndarray]: read-only arrays by name
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            _name = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[_name] = np.load(archive.open(info))
+                continue
+
+            # skip the zip local file header to reach the .npy member
+            f.seek(info.header_offset)
+            _name_length, _extra_length = struct.unpack("<HH", f.read(30)[26:])
+            f.seek(info.header_offset + 30 + _name_length + _extra_length)
+
+            _version = np.lib.format.read_magic(f)
+            if _version == (1, 0):
+                _shape, _fortran, _dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                _shape, _fortran, _dtype = np.lib.format.read_array_header_2_0(f)
+
+            arrays[_name] = np.memmap(path, dtype=_dtype, mode="r", offset=f.tell(),
+                                      shape=_shape, order="F" if _fortran else "C")
+    return arrays
+
+
+def read_model(arrays: Dict[str, np.ndarray],
+               initial_state: Tuple[float, float],
+               rng: np.random.Generator = None) -> SolarActivity:
+    """
+    Builds the model of a cache entry, which can be updated with new rows.
+
+    Args:
+        arrays (Dict[str, np.ndarray]): arrays of the entry, see memmap_npz
+        initial_state (Tuple[float, float]): Initial solar temperature and irradiance
+        rng (np.random.Generator, optional): random generator. Defaults to
+        the global numpy.random state.
+
+    Returns:
+        SolarActivity: solar activity model
+    """
+    _transition_minutes = int(arrays["transition_minutes"][()])
+    _counts = np.zeros(arrays["transition_matrices"].size, dtype=np.int64)
+    _counts[arrays["count_codes"]] = arrays["count_values"]
+    _season, _state = (int(_v) for _v in arrays["last_counted"])
+    _data_minutes, _position = (int(_v) for _v in arrays["resampler"])
+
+    return SolarActivity.from_tables(initial_state,
+                                     arrays["transition_matrices"],
+                                     arrays["cdf_tables"],
+                                     tuple(float(_b) for _b in arrays["bounds"]),
+                                     rng=rng,
+                                     step_minutes=int(arrays["step_minutes"][()]),
+                                     transition_minutes=_transition_minutes,
+                                     counts=_counts.reshape(arrays["transition_matrices"].shape),
+                                     last_counted=(_season, _state) if _season >= 0 else None,
+                                     resampler=StepResampler(_data_minutes, _transition_minutes, _position),
+                                     dataset_offset=int(arrays["dataset_offset"][()]))
+
+
+def load_solar_activity(initial_state: Tuple[float, float],
+                        solar_dataset: str = "data/solar_data.csv",
+                        cache_dir: str = None,
+                        rng: np.random.Generator = None,
+                        step_minutes: int = STEP_MINUTES) -> SolarActivity:
+    """
+    Returns the SolarActivity model of solar_dataset, loading it from the cache when
+    the dataset content, the discretization constants and the step length did not
+    change, and fitting and caching it otherwise. When rows were only appended to
+    the dataset since its cached fit, the cached model is updated with them (see
+    SolarActivity.update_from_csv: its bins stay those of the first fit, values out
+    of them go to the closest state). As a fit of the whole dataset could find other
+    bins, updated models are not stored under the key of the dataset content but
+    under a key of their first fit and of the lines they count, so that a content
+    key always names the model that a cold cache would fit. Stale cache entries of
+    the same dataset file and step length are removed.
+
+    Args:
+        initial_state (Tuple[float, float]): Initial solar temperature and irradiance
+        solar_dataset (str): Solar dataset file. Defaults to data/solar_data.csv
+        cache_dir (str, optional): cache folder. Defaults to .solar_cache next to the dataset.
+        rng (np.random.Generator, optional): random generator. Defaults to
+        the global numpy.random state.
+        step_minutes (int, optional): step length of the model. Defaults to STEP_MINUTES.
+
+    Returns:
+        SolarActivity: solar activity model
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(solar_dataset)), CACHE_FOLDER)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    key = cache_key(solar_dataset, step_minutes)
+    # datasets of the same name in other folders, or other step lengths, have entries of their own
+    _location = hashlib.sha256(os.path.abspath(solar_dataset).encode()).hexdigest()[:8]
+    _stem = f"{os.path.splitext(os.path.basename(solar_dataset))[0]}-{_location}-{step_minutes}"
+    path = os.path.join(cache_dir, f"{_stem}-{key[:16]}.npz")
+
+    if os.path.exists(path):
+        try:
+            arrays = memmap_npz(path)
+            if str(arrays["key"][()]) == key:
+                return read_model(arrays, initial_state, rng)
+        except (OSError, KeyError, ValueError, AssertionError, zipfile.BadZipFile):
+            pass # corrupted or outdated entry, fit again
+
+    solar_activity, _base_key = None, key
+    _entries = glob.glob(os.path.join(cache_dir, f"{glob.escape(_stem)}-*.npz"))
+    _size = nsrdb_complete_size(solar_dataset)
+    for _entry in _entries:
+        try:
+            # an entry of the first lines of the dataset, followed by new ones, is updated with them only
+            arrays = memmap_npz(_entry)
+            _offset = int(arrays["dataset_offset"][()])
+            if str(arrays["settings"][()]) != fit_settings(step_minutes) or _offset > _size \
+                    or dataset_hash(solar_dataset, _offset) != str(arrays["dataset_digest"][()]):
+                continue
+            if _offset == _size: # already updated with every complete line
+                return read_model(arrays, initial_state, rng)
+            # in-memory copies, the entry is removed below
+            solar_activity = read_model({_n: np.array(_a) for _n, _a in arrays.items()}, initial_state, rng)
+            solar_activity.update_from_csv(solar_dataset)
+            _base_key = str(arrays["base_key"][()])
+            break
+        except (OSError, KeyError, ValueError, AssertionError, zipfile.BadZipFile):
+            solar_activity, _base_key = None, key # corrupted or outdated entry, fit again
+
+    for _stale in _entries:
+        with contextlib.suppress(FileNotFoundError): # removed by a concurrent load
+            os.remove(_stale)
+
+    if solar_activity is None:
+        solar_activity = SolarActivity(initial_state, solar_dataset, rng=rng, step_minutes=step_minutes)
+    _digest = dataset_hash(solar_dataset, solar_activity.dataset_offset)
+    if _base_key != key:
+        key = hashlib.sha256(f"{_base_key}:{_digest}:{solar_activity.dataset_offset}".encode()).hexdigest()
+        path = os.path.join(cache_dir, f"{_stem}-{key[:16]}.npz")
+    save_model(solar_activity, path, key, _digest, _base_key)
+
+    return solar_activity
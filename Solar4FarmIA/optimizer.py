@@ -0,0 +1,213 @@
+import itertools
+import numpy as np
+from typing import List, Sequence
+from const import CHARGE_THRESHOLD, ACTIVE_CURRENT, CAPACITY_COEFFICIENT, OPERATION_VOLTAGE, MAX_CAPACITY
+from solar_activity import SolarActivity
+from power_system import PowerSystem
+from bot import Bot
+from batch_simulation import BatchSimulation
+from running_statistics import RunningStatistics
+
+
+PANEL_POWER_PER_AREA = 1000 # W of maximal power per m^2 and unit of efficiency
+
+
+def design_space(areas: Sequence[float],
+                 efficiencies: Sequence[float],
+                 materials: Sequence[str],
+                 countries: Sequence[str],
+                 battery_capacities: Sequence[float] = (None,)) -> List[PowerSystem]:
+    """
+    Builds the power system of every combination of design parameters. The maximal
+    power of the panel is derived from its area and efficiency. Battery capacities
+    too small to cover the active current are left out, None stands for the capacity
+    sized according to the panel power.
+
+    Args:
+        areas (Sequence[float]): solar panel areas in m^2
+        efficiencies (Sequence[float]): solar panel efficiencies
+        materials (Sequence[str]): solar panel materials
+        countries (Sequence[str]): production countries
+        battery_capacities (Sequence[float], optional): battery capacities. Defaults to (None,).
+
+    Returns:
+        List[PowerSystem]: candidate power systems
+    """
+    power_systems = []
+
+    for _area, _efficiency, _material, _country, _capacity in itertools.product(
+            areas, efficiencies, materials, countries, battery_capacities):
+        _max_power = _area * _efficiency * PANEL_POWER_PER_AREA
+        _sized = _capacity
+        if _sized is None:
+            _sized = min(CAPACITY_COEFFICIENT * (_max_power / OPERATION_VOLTAGE), MAX_CAPACITY)
+        if CHARGE_THRESHOLD * _sized <= ACTIVE_CURRENT:
+            continue
+        power_systems.append(PowerSystem(solar_area=_area,
+                                         solar_efficiency=_efficiency,
+                                         production_country=_country,
+                                         max_power=_max_power,
+                                         material=_material,
+                                         battery_capacity=_capacity))
+
+    return power_systems
+
+
+def pareto_front(footprints: np.ndarray, efficiencies: np.ndarray) -> np.ndarray:
+    """
+    Finds the designs which no other design beats on both carbon footprint (lower)
+    and user efficiency (higher).
+
+    Args:
+        footprints (np.ndarray): carbon footprint of each design
+        efficiencies (np.ndarray): user efficiency of each design
+
+    Returns:
+        np.ndarray: mask of the non-dominated designs
+    """
+    _f = np.asarray(footprints)[:, None]
+    _e = np.asarray(efficiencies)[:, None]
+
+    # _dominates[j, i]: design j dominates design i
+    _dominates = (_f <= _f.T) & (_e >= _e.T) & ((_f < _f.T) | (_e > _e.T))
+    return ~_dominates.any(axis=0)
+
+
+class DesignOptimizer():
+    """
+    This class allows to search the Pareto front of carbon footprint vs. user
+    efficiency over a set of candidate power systems. Candidates are simulated in
+    rounds whose number of epochs grows geometrically (successive halving style).
+    After each round, a candidate is dropped when another one has a lower or equal
+    footprint and a user efficiency confidence interval entirely above its own,
+    so clearly dominated designs stop consuming simulation time. All candidates of
+    a round share the same solar and bot trajectories, hence candidates with the same
+    panel area, efficiency and battery capacity behave identically: only the one with
+    the lowest footprint is simulated, the others are dropped upfront.
+
+    Attributes:
+        solar_activity (SolarActivity): fitted solar activity model
+        bot (Bot): bot parameters
+        power_systems (List[PowerSystem]): candidate power systems
+        footprints (np.ndarray): carbon footprint of each candidate
+        statistics (RunningStatistics): per-epoch user efficiency (%) statistics of each candidate
+        epochs (np.ndarray): number of simulated epochs of each candidate
+        efficiencies (np.ndarray): mean user efficiency (%) of each candidate
+        deviations (np.ndarray): standard deviation of the per-epoch user efficiency
+        alive (np.ndarray): mask of the candidates still simulated
+        z (float): width of the confidence intervals in standard errors
+    """
+
+    def __init__(self,
+                 solar_activity: SolarActivity,
+                 bot: Bot,
+                 power_systems: List[PowerSystem],
+                 z: float = 3.0) -> None:
+        """
+        Computes the footprint of every candidate.
+
+        Args:
+            solar_activity (SolarActivity): fitted solar activity model
+            bot (Bot): bot parameters
+            power_systems (List[PowerSystem]): candidate power systems
+            z (float, optional): width of the confidence intervals in standard errors. Defaults to 3.0.
+        """
+        self.solar_activity = solar_activity
+        self.bot = bot
+        self.power_systems = power_systems
+        self.z = z
+
+        m = len(power_systems)
+        self.footprints = np.array([_ps.get_carbon_footprint() for _ps in power_systems])
+        self.statistics = RunningStatistics(m)
+        self.alive = np.zeros(m, dtype=bool)
+
+        _designs = {}
+        for i in np.argsort(self.footprints, kind="stable"):
+            _ps = power_systems[i]
+            _designs.setdefault((_ps.solar_area, _ps.solar_efficiency, _ps.max_battery_capacity), i)
+        self.alive[list(_designs.values())] = True
+
+    @property
+    def epochs(self) -> np.ndarray:
+        return self.statistics.count
+
+    @property
+    def efficiencies(self) -> np.ndarray:
+        return self.statistics.mean
+
+    @property
+    def deviations(self) -> np.ndarray:
+        return self.statistics.deviation()
+
+    def intervals(self) -> np.ndarray:
+        """
+        Confidence intervals of the user efficiency of each candidate.
+
+        Returns:
+            np.ndarray: lower and upper bounds of shape (M, 2)
+        """
+        return np.stack(self.statistics.interval(self.z), axis=1)
+
+    def run(self,
+            min_epochs: int = 8,
+            max_epochs: int = 512,
+            eta: int = 2,
+            rng: np.random.Generator = None) -> List[int]:
+        """
+        Runs simulation rounds of min_epochs, min_epochs * eta, ... up to max_epochs
+        epochs per surviving candidate.
+
+        Args:
+            min_epochs (int, optional): epochs of the first round. Defaults to 8.
+            max_epochs (int, optional): epochs simulated for the final candidates. Defaults to 512.
+            eta (int, optional): growth factor of the epochs between rounds. Defaults to 2.
+            rng (np.random.Generator, optional): random generator. Defaults to a fresh one.
+
+        Returns:
+            List[int]: indices of the Pareto front candidates, by increasing footprint,
+            empty without candidates (e.g. a design space whose batteries are all too small)
+        """
+        assert min_epochs >= 2 and eta >= 2
+        if rng is None:
+            rng = np.random.default_rng()
+        if not self.alive.any():
+            return []
+
+        _budget = min(min_epochs, max_epochs)
+        while True:
+            self.__simulate(np.flatnonzero(self.alive), _budget, rng)
+            self.__drop_dominated()
+            if _budget >= max_epochs:
+                break
+            _budget = min(_budget * eta, max_epochs)
+
+        _alive = np.flatnonzero(self.alive)
+        _front = _alive[pareto_front(self.footprints[_alive], self.efficiencies[_alive])]
+        return _front[np.argsort(self.footprints[_front], kind="stable")].tolist()
+
+    def __simulate(self, candidates: np.ndarray, budget: int, rng: np.random.Generator) -> None:
+        """
+        Simulates the candidates until each one has budget epochs.
+
+        Args:
+            candidates (np.ndarray): indices of the simulated candidates
+            budget (int): number of epochs to reach
+            rng (np.random.Generator): random generator
+        """
+        _epochs = budget - self.epochs[candidates[0]] # alive candidates share their history
+        _simulation = BatchSimulation(self.solar_activity, self.bot, [self.power_systems[i] for i in candidates])
+        _efficiencies = 100 * _simulation.run_per_epoch(_epochs, rng) / len(_simulation.seasons)
+        self.statistics.update(_efficiencies, candidates)
+
+    def __drop_dominated(self) -> None:
+        """
+        Drops the candidates clearly dominated by another alive candidate.
+        """
+        _alive = np.flatnonzero(self.alive)
+        _lower, _upper = self.intervals()[_alive].T
+        _f = self.footprints[_alive]
+
+        # _dominates[j, i]: candidate j clearly dominates candidate i
+        _dominates = (_f[:, None] <= _f[None, :]) & (_lower[:, None] > _upper[None, :])
+        self.alive[_alive[_dominates.any(axis=0)]] = False
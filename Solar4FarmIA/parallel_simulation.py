@@ -0,0 +1,141 @@
+import copy
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from solar_activity import SolarActivity
+from power_system import PowerSystem, PowerSystemBank
+from bot import Bot
+from timer import get_calendar
+from sampling import BufferedRandom
+
+
+_solar_activity = None # fitted model of the worker process
+
+
+def run_epochs(solar_activity: SolarActivity,
+               bot: Bot,
+               power_systems: List[PowerSystem],
+               epochs: int) -> List[List[int]]:
+    """
+    Simulates epochs years one after another, step by step (steps of the solar
+    activity model). The power systems are advanced together as a PowerSystemBank
+    and reset after each year, while the solar state and bot probability carry
+    over to the next year (the batch engine starts every year afresh instead).
+
+    Args:
+        solar_activity (SolarActivity): solar activity model
+        bot (Bot): simulated bot
+        power_systems (List[PowerSystem]): simulated power systems
+        epochs (int): number of simulated years
+
+    Returns:
+        List[List[int]]: [satisfied steps, simulated steps] of each power system
+    """
+    calendar = get_calendar(solar_activity.step_minutes)
+    bank = PowerSystemBank.from_power_systems(power_systems, step_hours=calendar.step_hours)
+    satisfied = np.zeros(len(bank), dtype=np.int64)
+
+    for _ in range(epochs):
+        for hour, month in calendar.active_steps:
+            solar_state = solar_activity.next_step(month)
+            bot_current = bot.next_step(hour, month)
+            satisfied += bank.next_step(bot_current, solar_state[1])
+        bank.reset()
+
+    hours = epochs * len(calendar.active_steps)
+    return [[int(_satisfied), hours] for _satisfied in satisfied]
+
+
+def _init_worker(solar_activity: SolarActivity) -> None:
+    """
+    Keeps the fitted solar activity model in the worker process. With the fork
+    start method the model is inherited from the parent without being copied.
+
+    Args:
+        solar_activity (SolarActivity): fitted solar activity model
+    """
+    global _solar_activity
+    _solar_activity = solar_activity
+
+
+def _run_chunk(bot: Bot,
+               power_systems: List[PowerSystem],
+               epochs: int,
+               seed: np.random.SeedSequence) -> List[List[int]]:
+    """
+    Simulates a chunk of epochs with a generator of its own.
+
+    Args:
+        bot (Bot): bot (copied by the executor)
+        power_systems (List[PowerSystem]): power systems (copied by the executor)
+        epochs (int): number of simulated years
+        seed (np.random.SeedSequence): seed of the chunk
+
+    Returns:
+        List[List[int]]: [satisfied hours, simulated hours] of each power system
+    """
+    rng = BufferedRandom(seed) # solar and bot draws come from one buffered stream
+
+    # shallow copy: transition tables are shared, only the state is private
+    solar_activity = copy.copy(_solar_activity)
+    solar_activity.rng = rng
+    bot.rng = rng
+
+    return run_epochs(solar_activity, bot, power_systems, epochs)
+
+
+def run_parallel(solar_activity: SolarActivity,
+                 bot: Bot,
+                 power_systems: List[PowerSystem],
+                 epochs: int,
+                 workers: int,
+                 seed: int = None) -> List[List[int]]:
+    """
+    Splits epochs across a process pool, one chunk per worker. Each chunk gets its
+    own numpy.random.Generator spawned from a SeedSequence, so results are identical
+    for a fixed seed and number of workers. The transition matrices are built once
+    by the caller and handed to the workers when they start.
+
+    Args:
+        solar_activity (SolarActivity): fitted solar activity model
+        bot (Bot): bot parameters and initial probability
+        power_systems (List[PowerSystem]): simulated power systems
+        epochs (int): number of simulated years
+        workers (int): number of worker processes
+        seed (int, optional): seed of the run. Defaults to fresh entropy.
+
+    Returns:
+        List[List[int]]: [satisfied hours, simulated hours] of each power system
+    """
+    assert workers >= 1
+
+    _seeds = np.random.SeedSequence(seed).spawn(workers)
+    _chunks = [len(_c) for _c in np.array_split(np.arange(epochs), workers)]
+
+    _methods = multiprocessing.get_all_start_methods()
+    _context = multiprocessing.get_context("fork" if "fork" in _methods else None)
+
+    # the generators are set in the workers, do not ship the global state
+    _model = copy.copy(solar_activity)
+    _model.rng = None
+    _bot = copy.copy(bot)
+    _bot.rng = None
+
+    activities = [[0, 0] for _ in range(len(power_systems))]
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=_context,
+                             initializer=_init_worker,
+                             initargs=(_model,)) as executor:
+        _results = executor.map(_run_chunk,
+                                [_bot] * workers,
+                                [power_systems] * workers,
+                                _chunks,
+                                _seeds)
+        for _activities in _results:
+            for i, (_satisfied, _total) in enumerate(_activities):
+                activities[i][0] += _satisfied
+                activities[i][1] += _total
+
+    return activities
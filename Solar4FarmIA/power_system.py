@@ -1,5 +1,6 @@
 from const import *
-from typing import Tuple
+from typing import List, Tuple
+import numpy as np
 
 
 class PowerSystem():
@@ -9,7 +10,8 @@ class PowerSystem():
                  solar_efficiency: float,
                  production_country: str,
                  max_power: float,
-                 material: str) -> None:
+                 material: str,
+                 battery_capacity: float = None) -> None:
         
         self.__solar_area = solar_area
         self.__solar_efficiency = solar_efficiency
@@ -17,7 +19,9 @@ class PowerSystem():
         self.__max_power = max_power
         self.__material = material
 
-        self.__max_battery_capacity = min(CAPACITY_COEFFICIENT * (self.__max_power / OPERATION_VOLTAGE), MAX_CAPACITY)
+        if battery_capacity is None: # sized according to the maximal current of the panel
+            battery_capacity = min(CAPACITY_COEFFICIENT * (self.__max_power / OPERATION_VOLTAGE), MAX_CAPACITY)
+        self.__max_battery_capacity = battery_capacity
         self.__main_battery_capacity = self.__max_battery_capacity
         self.__backup_battery_capacity = self.__max_battery_capacity
         self.__on_main_battery = True
@@ -29,6 +33,34 @@ class PowerSystem():
 
         assert self.__high_threshold > ACTIVE_CURRENT
 
+    @property
+    def solar_area(self) -> float:
+        return self.__solar_area
+
+    @property
+    def solar_efficiency(self) -> float:
+        return self.__solar_efficiency
+
+    @property
+    def max_power(self) -> float:
+        return self.__max_power
+
+    @property
+    def max_battery_capacity(self) -> float:
+        return self.__max_battery_capacity
+
+    @property
+    def low_threshold(self) -> float:
+        return self.__low_threshold
+
+    @property
+    def high_threshold(self) -> float:
+        return self.__high_threshold
+
+    @property
+    def on_main_battery(self) -> bool:
+        return self.__on_main_battery
+
     def reset(self):
         self.__main_battery_capacity = self.__max_battery_capacity
         self.__backup_battery_capacity = self.__max_battery_capacity
@@ -46,25 +78,25 @@ class PowerSystem():
 
         return solar_panel_footprint + battery_footprint
 
-    def __simulate_power_system(self, load_current: float, solar_current: float) -> Tuple[bool, bool]:
+    def __simulate_power_system(self, load: float, solar_current: float, charge: float) -> Tuple[bool, bool]:
 
         if self.__on_main_battery:
-            if self.__main_battery_capacity >= load_current and self.__main_battery_capacity >= self.__low_threshold:
-                self.__main_battery_capacity -= load_current
-                self.__total_battery_energy += load_current
+            if self.__main_battery_capacity >= load and self.__main_battery_capacity >= self.__low_threshold:
+                self.__main_battery_capacity -= load
+                self.__total_battery_energy += load
                 if solar_current >= (self.__max_battery_capacity / 2):
-                    self.__backup_battery_capacity += (self.__max_battery_capacity / 2)
+                    self.__backup_battery_capacity += charge
                     self.__backup_battery_capacity = min(self.__backup_battery_capacity, self.__max_battery_capacity)
                 return (True, False)
             else:
                 self.__on_main_battery = False
                 return (False, True)                     
         else:
-            if self.__backup_battery_capacity >= load_current:
-                self.__backup_battery_capacity -= load_current
-                self.__total_battery_energy += load_current
+            if self.__backup_battery_capacity >= load:
+                self.__backup_battery_capacity -= load
+                self.__total_battery_energy += load
                 if solar_current >= (self.__max_battery_capacity / 2):
-                    self.__main_battery_capacity += (self.__max_battery_capacity / 2)
+                    self.__main_battery_capacity += charge
                     self.__main_battery_capacity = min(self.__main_battery_capacity, self.__max_battery_capacity)
                 return (True, False)
             else:
@@ -76,15 +108,158 @@ class PowerSystem():
 
 
 
-    def next_step(self, load_current: float, solar_state: Tuple[float, float]) -> bool:
+    def next_step(self, load_current: float, solar_state: Tuple[float, float], step_hours: float = 1.0) -> bool:
 
         _solar_current = (solar_state[1] * self.__solar_area) * self.__solar_efficiency / OPERATION_VOLTAGE
+        # currents last one step: step_hours of load and of charge
+        _load = load_current * step_hours
+        _charge = (self.__max_battery_capacity / 2) * step_hours
 
-        _satisfy, _switch = self.__simulate_power_system(load_current, _solar_current)
+        _satisfy, _switch = self.__simulate_power_system(_load, _solar_current, _charge)
         
         if _switch:
-            _satisfy, _switch = self.__simulate_power_system(load_current, _solar_current)
+            _satisfy, _switch = self.__simulate_power_system(_load, _solar_current, _charge)
 
         assert _switch == False
 
-        return _satisfy
\ No newline at end of file
+        return _satisfy
+
+
+class PowerSystemBank():
+    """
+    Fleet of power systems stored as struct-of-arrays. All systems are advanced
+    by one step (one hour by default) at once with masked NumPy operations that follow
+    PowerSystem.next_step exactly, including the switch between main and backup
+    batteries within the step.
+    With trajectories, every system also holds one battery state per independent
+    trajectory and state arrays have shape (M, trajectories).
+
+    Attributes:
+        solar_area (np.ndarray): solar panel area of each system
+        solar_efficiency (np.ndarray): solar panel efficiency of each system
+        max_battery_capacity (np.ndarray): battery capacity of each system
+        low_threshold (np.ndarray): discharge threshold of each system
+        high_threshold (np.ndarray): charge threshold of each system
+        main_battery_capacity (np.ndarray): main battery charge
+        backup_battery_capacity (np.ndarray): backup battery charge
+        on_main_battery (np.ndarray): main battery in use
+        total_battery_energy (np.ndarray): energy drawn from batteries
+        step_hours (float): step length in hours
+    """
+
+    def __init__(self,
+                 solar_area: np.ndarray,
+                 solar_efficiency: np.ndarray,
+                 max_power: np.ndarray,
+                 trajectories: int = None,
+                 battery_capacity: np.ndarray = None,
+                 step_hours: float = 1.0) -> None:
+        """
+        Computes battery capacities and thresholds of every system like PowerSystem does.
+
+        Args:
+            solar_area (np.ndarray): solar panel area of each system
+            solar_efficiency (np.ndarray): solar panel efficiency of each system
+            max_power (np.ndarray): solar panel maximal power of each system
+            trajectories (int, optional): number of independent trajectories. Defaults to None.
+            battery_capacity (np.ndarray, optional): battery capacity of each system.
+            Defaults to the capacity sized according to max_power.
+            step_hours (float, optional): step length in hours. Defaults to 1.0.
+        """
+        _shape = (-1,) if trajectories is None else (-1, 1)
+        self.trajectories = trajectories
+
+        self.solar_area = np.asarray(solar_area, dtype=float).reshape(_shape)
+        self.solar_efficiency = np.asarray(solar_efficiency, dtype=float).reshape(_shape)
+        _max_power = np.asarray(max_power, dtype=float).reshape(_shape)
+
+        if battery_capacity is None:
+            self.max_battery_capacity = np.minimum(CAPACITY_COEFFICIENT * (_max_power / OPERATION_VOLTAGE), MAX_CAPACITY)
+        else:
+            self.max_battery_capacity = np.asarray(battery_capacity, dtype=float).reshape(_shape)
+        self.low_threshold = DISCHARGE_THRESHOLD * self.max_battery_capacity
+        self.high_threshold = CHARGE_THRESHOLD * self.max_battery_capacity
+        self.__half_capacity = self.max_battery_capacity / 2
+        self.step_hours = step_hours
+        self.__step_charge = self.__half_capacity * step_hours # charge of one step
+
+        assert (self.high_threshold > ACTIVE_CURRENT).all()
+
+        self.reset()
+
+    @classmethod
+    def from_power_systems(cls,
+                           power_systems: List[PowerSystem],
+                           trajectories: int = None,
+                           step_hours: float = 1.0) -> "PowerSystemBank":
+        """
+        Builds a bank from PowerSystem objects.
+
+        Args:
+            power_systems (List[PowerSystem]): power systems
+            trajectories (int, optional): number of independent trajectories. Defaults to None.
+            step_hours (float, optional): step length in hours. Defaults to 1.0.
+
+        Returns:
+            PowerSystemBank: bank of the power systems
+        """
+        return cls([_ps.solar_area for _ps in power_systems],
+                   [_ps.solar_efficiency for _ps in power_systems],
+                   [_ps.max_power for _ps in power_systems],
+                   trajectories=trajectories,
+                   battery_capacity=[_ps.max_battery_capacity for _ps in power_systems],
+                   step_hours=step_hours)
+
+    def __len__(self) -> int:
+        return len(self.max_battery_capacity)
+
+    def reset(self) -> None:
+        """
+        Recharges both batteries of every system and switches them to the main battery.
+        """
+        _shape = (len(self),) if self.trajectories is None else (len(self), self.trajectories)
+        self.main_battery_capacity = np.broadcast_to(self.max_battery_capacity, _shape).copy()
+        self.backup_battery_capacity = self.main_battery_capacity.copy()
+        self.on_main_battery = np.ones(_shape, dtype=bool)
+        self.total_battery_energy = np.zeros(_shape)
+
+    def next_step(self, load_current, irradiance) -> np.ndarray:
+        """
+        Simulates one step of every system.
+
+        Args:
+            load_current (float or np.ndarray): bot current (one per trajectory)
+            irradiance (float or np.ndarray): solar irradiance (one per trajectory)
+
+        Returns:
+            np.ndarray: demand satisfied for each system (and trajectory)
+        """
+        _main = self.main_battery_capacity
+        _backup = self.backup_battery_capacity
+        _on_main = self.on_main_battery
+
+        _solar_current = (irradiance * self.solar_area) * self.solar_efficiency / OPERATION_VOLTAGE
+        _charge = _solar_current >= self.__half_capacity
+        _load = load_current * self.step_hours
+
+        # a failing main battery switches to the backup one within the step, and a
+        # failing backup battery switches back when the main one is charged enough
+        _draw_main = _on_main & (_main >= _load) & (_main >= self.low_threshold)
+        _to_backup = _on_main & ~_draw_main
+        _draw_backup = ~_draw_main & (_backup >= _load)
+        _to_main = ~_on_main & ~_draw_backup & (_main >= self.high_threshold)
+        _draw_main |= _to_main
+        _satisfy = _draw_main | _draw_backup
+
+        _main -= np.where(_draw_main, _load, 0.0)
+        _backup -= np.where(_draw_backup, _load, 0.0)
+        self.total_battery_energy += np.where(_satisfy, _load, 0.0)
+        np.copyto(_backup, np.minimum(_backup + self.__step_charge, self.max_battery_capacity),
+                  where=_draw_main & _charge)
+        np.copyto(_main, np.minimum(_main + self.__step_charge, self.max_battery_capacity),
+                  where=_draw_backup & _charge)
+
+        _on_main &= ~_to_backup
+        _on_main |= _to_main
+
+        return _satisfy
@@ -0,0 +1,84 @@
+import numpy as np
+from statistics import NormalDist
+from typing import Tuple
+
+
+def normal_quantile(confidence: float) -> float:
+    """
+    Returns the number of standard errors of a two-sided normal confidence interval.
+
+    Args:
+        confidence (float): confidence level, e.g. 0.95
+
+    Returns:
+        float: normal quantile of (1 + confidence) / 2
+    """
+    assert 0.0 < confidence < 1.0
+    return NormalDist().inv_cdf((1.0 + confidence) / 2)
+
+
+class RunningStatistics():
+    """
+    Running mean and variance of several quantities (e.g. the user efficiency of
+    each power system), updated with batches of samples without keeping them
+    (Chan et al. parallel variant of Welford's algorithm).
+
+    Attributes:
+        count (np.ndarray): number of samples of each quantity
+        mean (np.ndarray): mean of each quantity
+        m2 (np.ndarray): sum of squared deviations from the mean of each quantity
+    """
+
+    def __init__(self, size: int) -> None:
+        """
+        Args:
+            size (int): number of quantities
+        """
+        self.count = np.zeros(size, dtype=np.int64)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    def update(self, samples: np.ndarray, indices: np.ndarray = None) -> None:
+        """
+        Merges a batch of samples.
+
+        Args:
+            samples (np.ndarray): samples of shape (quantities, batch)
+            indices (np.ndarray, optional): updated quantities. Defaults to all of them.
+        """
+        if indices is None:
+            indices = np.arange(len(self.count))
+
+        _n = samples.shape[1]
+        if _n == 0:
+            return
+        _mean = samples.mean(axis=1)
+        _m2 = ((samples - _mean[:, None]) ** 2).sum(axis=1)
+
+        _count = self.count[indices]
+        _total = _count + _n
+        _delta = _mean - self.mean[indices]
+
+        self.mean[indices] += _delta * _n / _total
+        self.m2[indices] += _m2 + _delta ** 2 * _count * _n / _total
+        self.count[indices] = _total
+
+    def deviation(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: sample standard deviation of each quantity
+        """
+        return np.sqrt(self.m2 / np.maximum(self.count - 1, 1))
+
+    def interval(self, z: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Confidence interval of the mean of each quantity.
+
+        Args:
+            z (float): half width of the interval in standard errors
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: lower and upper bounds
+        """
+        _half_width = z * self.deviation() / np.sqrt(np.maximum(self.count, 1))
+        return self.mean - _half_width, self.mean + _half_width
@@ -0,0 +1,179 @@
+import numpy as np
+from typing import Union
+
+
+BLOCK_SIZE = 1 << 14 # random numbers drawn at once
+
+
+class BufferedRandom():
+    """
+    Random source serving uniform draws from blocks pre-drawn with a
+    numpy.random.Generator, so that scalar draws cost a list lookup instead of
+    a NumPy call. It provides the uniform method used by SolarActivity and Bot,
+    so one instance can be shared by both: the draws are then the successive
+    values of a single generator stream, reproducible from one seed.
+
+    Attributes:
+        generator (np.random.Generator): underlying generator
+        block_size (int): number of values drawn per block
+    """
+
+    def __init__(self, seed: Union[int, np.random.SeedSequence, np.random.Generator] = None,
+                 block_size: int = BLOCK_SIZE) -> None:
+        """
+        Args:
+            seed (int, np.random.SeedSequence or np.random.Generator, optional): seed or generator.
+            Defaults to fresh entropy.
+            block_size (int, optional): number of values drawn per block. Defaults to BLOCK_SIZE.
+        """
+        assert block_size > 0
+        self.generator = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+        self.block_size = block_size
+        self.__buffer = []
+        self.__position = 0
+        self.__block_state = None # generator state before drawing the buffered block
+
+    @property
+    def state(self) -> dict:
+        """
+        State of the stream: the generator state before the buffered block and the
+        position in the block, or the generator state when the block is used up.
+        It is json serializable and allows to resume the stream exactly.
+
+        Returns:
+            dict: stream state
+        """
+        if self.__position == len(self.__buffer):
+            return {"bit_generator": self.generator.bit_generator.state, "block_size": 0, "position": 0}
+        return {"bit_generator": self.__block_state, "block_size": len(self.__buffer), "position": self.__position}
+
+    @state.setter
+    def state(self, state: dict) -> None:
+        self.generator.bit_generator.state = state["bit_generator"]
+        self.__block_state = state["bit_generator"]
+        self.__buffer = self.generator.random(state["block_size"]).tolist()
+        self.__position = state["position"]
+
+    def uniform(self, low: float = 0.0, high: float = 1.0) -> float:
+        """
+        Returns:
+            float: next uniform draw in [low, high)
+        """
+        if self.__position == len(self.__buffer):
+            self.__block_state = self.generator.bit_generator.state
+            self.__buffer = self.generator.random(self.block_size).tolist()
+            self.__position = 0
+        _x = self.__buffer[self.__position]
+        self.__position += 1
+        return low + (high - low) * _x
+
+    def random(self, size: int = None) -> Union[float, np.ndarray]:
+        """
+        Next uniform draws in [0, 1), taken from the buffer first so that block
+        and scalar draws can be mixed without breaking the stream.
+
+        Args:
+            size (int, optional): number of draws. Defaults to a single float.
+
+        Returns:
+            float or np.ndarray: uniform draws
+        """
+        if size is None:
+            return self.uniform()
+        _left = self.__buffer[self.__position:self.__position + size]
+        self.__position += len(_left)
+        if len(_left) == size:
+            return np.array(_left)
+        return np.concatenate((_left, self.generator.random(size - len(_left))))
+
+
+class AliasTables():
+    """
+    Walker/Vose alias tables of every row of seasonal transition matrices. A row
+    of N probabilities becomes N columns holding a probability and an alias: a
+    uniform draw u picks the column int(u * N) and its fractional part chooses
+    between the column and its alias, so each transition costs O(1).
+
+    Attributes:
+        probability (np.ndarray): probability of keeping each column, of shape (season, N, N)
+        alias (np.ndarray): alias of each column, of shape (season, N, N)
+    """
+
+    def __init__(self, transition_matrices: np.ndarray) -> None:
+        """
+        Builds the tables of each row with Vose's algorithm.
+
+        Args:
+            transition_matrices (np.ndarray): transition matrices of shape (season, N, N)
+        """
+        _seasons, _n, _ = transition_matrices.shape
+        _scaled = transition_matrices.reshape((-1, _n)).astype(float)
+        _scaled = _scaled / _scaled.sum(axis=1, keepdims=True) * _n
+
+        self.probability = np.ones_like(_scaled)
+        self.alias = np.tile(np.arange(_n, dtype=np.int32), (len(_scaled), 1))
+
+        for _r, _row in enumerate(_scaled.tolist()):
+            _small = [j for j, p in enumerate(_row) if p < 1.0]
+            _large = [j for j, p in enumerate(_row) if p >= 1.0]
+            _probability = self.probability[_r]
+            _alias = self.alias[_r]
+            while _small and _large:
+                _s = _small.pop()
+                _l = _large.pop()
+                _probability[_s] = _row[_s]
+                _alias[_s] = _l
+                _row[_l] = (_row[_l] + _row[_s]) - 1.0
+                (_small if _row[_l] < 1.0 else _large).append(_l)
+            # leftovers are 1 up to rounding errors, they keep their own column
+
+        self.probability = self.probability.reshape((_seasons, _n, _n))
+        self.alias = self.alias.reshape((_seasons, _n, _n))
+
+    def sample(self, season: int, state: int, u: float) -> int:
+        """
+        Samples the next state of one chain.
+
+        Args:
+            season (int): season index
+            state (int): current state index
+            u (float): uniform draw in [0, 1)
+
+        Returns:
+            int: next state index
+        """
+        _x = u * self.probability.shape[2]
+        _column = int(_x)
+        if _x - _column < self.probability[season, state, _column]:
+            return _column
+        return int(self.alias[season, state, _column])
+
+    def sample_many(self, season: int, states: np.ndarray, uniforms: np.ndarray) -> np.ndarray:
+        """
+        Samples the next state of many chains of the same season at once.
+
+        Args:
+            season (int): season index
+            states (np.ndarray): current state index of each chain
+            uniforms (np.ndarray): uniform draw of each chain in [0, 1)
+
+        Returns:
+            np.ndarray: next state index of each chain
+        """
+        _x = uniforms * self.probability.shape[2]
+        _columns = _x.astype(np.intp)
+        _keep = (_x - _columns) < self.probability[season, states, _columns]
+        return np.where(_keep, _columns, self.alias[season, states, _columns])
+
+    def distributions(self) -> np.ndarray:
+        """
+        Transition probabilities represented by the tables, to check them.
+
+        Returns:
+            np.ndarray: transition matrices of shape (season, N, N)
+        """
+        _seasons, _n, _ = self.probability.shape
+        _matrices = self.probability.reshape((-1, _n)) / _n
+        _rows = np.repeat(np.arange(len(_matrices)), _n)
+        np.add.at(_matrices, (_rows, self.alias.reshape(-1)), (1.0 - self.probability.reshape(-1)) / _n)
+        return _matrices.reshape((_seasons, _n, _n))
@@ -0,0 +1,277 @@
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator
+from const import BOT_PARAMETERS
+from solar_activity import SolarActivity
+from model_cache import load_solar_activity
+from simulation import simulate, panel_power_systems
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # pyarrow is optional, results are then written to csv only
+    pa = None
+
+
+MODEL_STORE_SIZE = 4 # fitted models kept in memory by each process
+INFLIGHT_TASKS = 2 # scheduled scenarios per worker, bounds the memory of pending results
+
+_model_store = None # model store of the worker process
+
+
+class ModelStore():
+    """
+    Bounded store of fitted SolarActivity models, evicting the least recently used
+    one. Models come from the on-disk model cache (see model_cache.py), so they are
+    memory-mapped and a dataset is only fitted once across processes.
+
+    Attributes:
+        capacity (int): maximal number of models kept
+        cache_dir (str): model cache folder, None for the default one
+    """
+
+    def __init__(self, capacity: int = MODEL_STORE_SIZE, cache_dir: str = None) -> None:
+        """
+        Args:
+            capacity (int, optional): maximal number of models kept. Defaults to MODEL_STORE_SIZE.
+            cache_dir (str, optional): model cache folder. Defaults to .solar_cache next to each dataset.
+        """
+        assert capacity >= 1
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self.__models = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.__models)
+
+    def __contains__(self, solar_dataset: str) -> bool:
+        return os.path.abspath(solar_dataset) in self.__models
+
+    def get(self, solar_dataset: str) -> SolarActivity:
+        """
+        Returns the model of a solar dataset, loading it when it is not stored.
+
+        Args:
+            solar_dataset (str): solar dataset file
+
+        Returns:
+            SolarActivity: solar activity model
+        """
+        _key = os.path.abspath(solar_dataset)
+        if _key in self.__models:
+            self.__models.move_to_end(_key)
+            return self.__models[_key]
+
+        model = load_solar_activity(initial_state=(0.0, 0.0), solar_dataset=_key, cache_dir=self.cache_dir)
+        self.__models[_key] = model
+        if len(self.__models) > self.capacity:
+            self.__models.popitem(last=False)
+        return model
+
+
+def read_manifest(manifest: str) -> Dict[str, Any]:
+    """
+    Reads a json scenario manifest. Sites and catalogs map names to files, relative
+    to the manifest folder, and bots map names to Bot parameters:
+
+        {"sites": {"paris": "data/solar_data.csv"},
+         "catalogs": {"allo_solar": "data/solar_panel.csv"},
+         "bots": {"default": {"initial_probability": 0.005, "dp_winter": 0.01, ...}},
+         "epochs": 100, "seed": 0}
+
+    Bots default to BOT_PARAMETERS, epochs to 1 and seed to fresh entropy.
+
+    Args:
+        manifest (str): manifest file
+
+    Returns:
+        Dict[str, Any]: manifest with absolute paths
+    """
+    with open(manifest) as f:
+        _manifest = json.load(f)
+
+    _folder = os.path.dirname(os.path.abspath(manifest))
+    for _field in ("sites", "catalogs"):
+        assert _manifest.get(_field), f"the manifest has no {_field}"
+        _manifest[_field] = {_name: os.path.join(_folder, _path) for _name, _path in _manifest[_field].items()}
+    _manifest.setdefault("bots", {"default": BOT_PARAMETERS})
+    _manifest.setdefault("epochs", 1)
+    _manifest.setdefault("seed", None)
+    return _manifest
+
+
+def scenarios(manifest: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Enumerates every site x catalog x bot scenario, site by site so that
+    consecutive scenarios share their model.
+
+    Args:
+        manifest (Dict[str, Any]): manifest (see read_manifest)
+
+    Yields:
+        Dict[str, Any]: scenario names, files and bot parameters
+    """
+    for (_site, _dataset), (_catalog, _panels), (_bot, _params) in itertools.product(
+            manifest["sites"].items(), manifest["catalogs"].items(), manifest["bots"].items()):
+        yield {"site": _site, "solar_data": _dataset,
+               "catalog": _catalog, "solar_panel": _panels,
+               "bot": _bot, "bot_params": _params}
+
+
+def _init_worker(capacity: int, cache_dir: str) -> None:
+    """
+    Creates the model store of the worker process.
+
+    Args:
+        capacity (int): maximal number of models kept
+        cache_dir (str): model cache folder
+    """
+    global _model_store
+    _model_store = ModelStore(capacity, cache_dir)
+
+
+def _fit_site(solar_dataset: str, cache_dir: str) -> None:
+    """
+    Fits the model of a site into the model cache, unless it is already there.
+
+    Args:
+        solar_dataset (str): solar dataset file
+        cache_dir (str): model cache folder
+    """
+    load_solar_activity(initial_state=(0.0, 0.0), solar_dataset=solar_dataset, cache_dir=cache_dir)
+
+
+def _run_scenario(scenario: Dict[str, Any], epochs: int, seed: np.random.SeedSequence) -> pd.DataFrame:
+    """
+    Simulates the panel catalog of a scenario at its site.
+
+    Args:
+        scenario (Dict[str, Any]): scenario (see scenarios)
+        epochs (int): number of simulated years
+        seed (np.random.SeedSequence): seed of the scenario
+
+    Returns:
+        pd.DataFrame: simulate results with the site, catalog and bot names
+    """
+    solar_activity = _model_store.get(scenario["solar_data"])
+    results = simulate(panel_power_systems(scenario["solar_panel"]), solar_activity,
+                       bot_params=scenario["bot_params"], epochs=epochs, seed=seed)
+    results.insert(0, "bot", scenario["bot"])
+    results.insert(0, "catalog", scenario["catalog"])
+    results.insert(0, "site", scenario["site"])
+    return results
+
+
+class ResultWriter():
+    """
+    Appends result frames to a single parquet (row group per frame) or csv file,
+    so that results do not accumulate in memory.
+
+    Attributes:
+        output (str): result file
+        rows (int): number of written rows
+    """
+
+    def __init__(self, output: str) -> None:
+        """
+        Args:
+            output (str): result file, .parquet (needs pyarrow) or .csv
+        """
+        _extension = os.path.splitext(output)[1].lower()
+        if _extension not in (".parquet", ".csv"):
+            raise ValueError(f"Unknown output format {_extension}, use .parquet or .csv")
+        if _extension == ".parquet" and pa is None:
+            raise ImportError("pyarrow is needed to write parquet files, install it or write a .csv file")
+
+        self.output = output
+        self.rows = 0
+        self.__parquet = _extension == ".parquet"
+        self.__writer = None
+
+    def write(self, results: pd.DataFrame) -> None:
+        """
+        Args:
+            results (pd.DataFrame): appended results
+        """
+        if self.__parquet:
+            if self.__writer is None:
+                _table = pa.Table.from_pandas(results, preserve_index=False)
+                self.__writer = pq.ParquetWriter(self.output, _table.schema)
+            else:
+                _table = pa.Table.from_pandas(results, schema=self.__writer.schema, preserve_index=False)
+            self.__writer.write_table(_table)
+        else:
+            results.to_csv(self.output, mode="w" if self.rows == 0 else "a", header=self.rows == 0, index=False)
+        self.rows += len(results)
+
+    def close(self) -> None:
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+
+def run_scenarios(manifest: Dict[str, Any],
+                  output: str,
+                  workers: int = 1,
+                  store_size: int = MODEL_STORE_SIZE,
+                  cache_dir: str = None) -> int:
+    """
+    Runs every scenario of a manifest. Site models are first fitted into the model
+    cache, one task per site, then scenarios are scheduled across workers processes
+    (with at most INFLIGHT_TASKS pending per worker) and their results are written
+    to output as soon as they finish, in completion order. Each scenario has its own
+    seed spawned from the manifest seed, so results do not depend on scheduling.
+
+    Args:
+        manifest (Dict[str, Any]): manifest (see read_manifest)
+        output (str): result file, .parquet or .csv
+        workers (int, optional): number of worker processes, 1 runs in this process. Defaults to 1.
+        store_size (int, optional): models kept in memory by each process. Defaults to MODEL_STORE_SIZE.
+        cache_dir (str, optional): model cache folder. Defaults to .solar_cache next to each dataset.
+
+    Returns:
+        int: number of written rows
+    """
+    assert workers >= 1
+    _scenarios = scenarios(manifest)
+    _count = len(manifest["sites"]) * len(manifest["catalogs"]) * len(manifest["bots"])
+    _seeds = iter(np.random.SeedSequence(manifest["seed"]).spawn(_count))
+    writer = ResultWriter(output)
+
+    try:
+        if workers == 1:
+            _init_worker(store_size, cache_dir)
+            for _scenario, _seed in zip(_scenarios, _seeds):
+                writer.write(_run_scenario(_scenario, manifest["epochs"], _seed))
+            return writer.rows
+
+        _methods = multiprocessing.get_all_start_methods()
+        _context = multiprocessing.get_context("fork" if "fork" in _methods else None)
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=_context,
+                                 initializer=_init_worker,
+                                 initargs=(store_size, cache_dir)) as executor:
+            # fit each site once, in parallel, before any simulation needs it
+            for _future in [executor.submit(_fit_site, _dataset, cache_dir)
+                            for _dataset in set(manifest["sites"].values())]:
+                _future.result()
+
+            _pending = set()
+            for _scenario, _seed in zip(_scenarios, _seeds):
+                if len(_pending) >= INFLIGHT_TASKS * workers:
+                    _done, _pending = wait(_pending, return_when=FIRST_COMPLETED)
+                    for _future in _done:
+                        writer.write(_future.result())
+                _pending.add(executor.submit(_run_scenario, _scenario, manifest["epochs"], _seed))
+            for _future in wait(_pending).done:
+                writer.write(_future.result())
+    finally:
+        writer.close()
+
+    return writer.rows
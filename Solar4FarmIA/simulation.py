@@ -0,0 +1,184 @@
+import copy
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List
+from const import BOT_PARAMETERS
+from solar_activity import SolarActivity
+from power_system import PowerSystem
+from bot import Bot
+from batch_simulation import BatchSimulation
+from kernel import FusedSimulation
+from parallel_simulation import run_epochs, run_parallel
+from sampling import BufferedRandom
+from running_statistics import RunningStatistics, normal_quantile
+from catalog import PanelCatalog
+from common_random_numbers import TRAJECTORY_FOLDER, TrajectoryCache
+
+
+ENGINES = ("batch", "fused", "serial", "parallel", "common") # available simulation engines
+
+
+def panel_power_systems(solar_panel: str) -> List[PowerSystem]:
+    """
+    Builds the power systems of a solar panel csv file (see data/solar_panel.csv).
+    The catalog is validated as a whole first (see PanelCatalog).
+
+    Args:
+        solar_panel (str): solar panel file
+
+    Returns:
+        List[PowerSystem]: power system of each panel
+    """
+    return PanelCatalog.read(solar_panel).power_systems()
+
+
+def surface_power_systems(surfaces: Iterable[float] = range(3, 20, 1)) -> List[PowerSystem]:
+    """
+    Builds the power systems of the surface comparison: 20% efficiency monocrystalline
+    panels produced in France.
+
+    Args:
+        surfaces (Iterable[float], optional): panel surfaces in m^2. Defaults to 3 to 19.
+
+    Returns:
+        List[PowerSystem]: power system of each surface
+    """
+    return [PowerSystem(solar_area = s,
+                        solar_efficiency = 0.2,
+                        production_country = "France",
+                        max_power = s * 0.2 * 1000,
+                        material = "Monosillicium") for s in surfaces]
+
+
+def simulate(power_systems: List[PowerSystem],
+             solar_model: SolarActivity,
+             bot_params: Dict[str, float] = None,
+             epochs: int = 1,
+             engine: str = "batch",
+             seed: int = None,
+             workers: int = 1,
+             trajectory_dir: str = TRAJECTORY_FOLDER) -> pd.DataFrame:
+    """
+    Simulates epochs years of FarmBot powered by each power system.
+    The batch engine simulates all epochs at once, the fused one runs a single
+    compiled hour loop (numba, or NumPy when it is not installed), the serial one
+    simulates hour by hour with the reference classes and the parallel one splits
+    epochs across workers processes. The common one replays the power systems against
+    solar and bot trajectories cached per seed (see TrajectoryCache), so that runs of
+    the same seed compare power systems on the same years. Given objects are not modified.
+
+    Args:
+        power_systems (List[PowerSystem]): simulated power systems
+        solar_model (SolarActivity): fitted solar activity model
+        bot_params (Dict[str, float], optional): Bot parameters. Defaults to BOT_PARAMETERS.
+        epochs (int, optional): number of simulated years. Defaults to 1.
+        engine (str, optional): one of ENGINES. Defaults to "batch".
+        seed (int, optional): random seed. Defaults to fresh entropy.
+        workers (int, optional): worker processes of the parallel engine. Defaults to 1.
+        trajectory_dir (str, optional): trajectory cache of the common engine. Defaults to TRAJECTORY_FOLDER.
+
+    Returns:
+        pd.DataFrame: one row per power system, with its satisfied and simulated hours
+        (steps of the solar model), user efficiency (%), carbon footprint (kgCO_2) and sizing
+    """
+    if bot_params is None:
+        bot_params = BOT_PARAMETERS
+    bot = Bot(**bot_params, step_hours=solar_model.step_minutes / 60)
+
+    if engine == "batch":
+        activities = BatchSimulation(solar_model, bot, power_systems).run(epochs, np.random.default_rng(seed))
+    elif engine == "fused":
+        activities = FusedSimulation(solar_model, bot, power_systems).run(epochs, np.random.default_rng(seed))
+    elif engine == "serial":
+        rng = BufferedRandom(seed)
+        _solar_model = copy.copy(solar_model)
+        _solar_model.rng = rng
+        bot.rng = rng
+        activities = run_epochs(_solar_model, bot, power_systems, epochs)
+    elif engine == "parallel":
+        activities = run_parallel(solar_model, bot, power_systems, epochs, workers, seed)
+    elif engine == "common":
+        activities = TrajectoryCache.load(solar_model, bot, epochs, seed, trajectory_dir).run(power_systems, epochs)
+    else:
+        raise ValueError(f"Unknown simulation engine {engine}, use one of {ENGINES}")
+
+    return results_frame(power_systems, activities)
+
+
+def simulate_adaptive(power_systems: List[PowerSystem],
+                      solar_model: SolarActivity,
+                      bot_params: Dict[str, float] = None,
+                      target_width: float = 1.0,
+                      confidence: float = 0.95,
+                      batch_epochs: int = 256,
+                      max_epochs: int = 100000,
+                      seed: int = None) -> pd.DataFrame:
+    """
+    Simulates epochs by batches with the batch engine until the confidence interval
+    of the user efficiency of every power system is narrower than target_width
+    (in percentage points), or max_epochs epochs were simulated.
+
+    Args:
+        power_systems (List[PowerSystem]): simulated power systems
+        solar_model (SolarActivity): fitted solar activity model
+        bot_params (Dict[str, float], optional): Bot parameters. Defaults to BOT_PARAMETERS.
+        target_width (float, optional): confidence interval width (%). Defaults to 1.0.
+        confidence (float, optional): confidence level of the intervals. Defaults to 0.95.
+        batch_epochs (int, optional): epochs simulated between two checks. Defaults to 256.
+        max_epochs (int, optional): maximal number of simulated years. Defaults to 100000.
+        seed (int, optional): random seed. Defaults to fresh entropy.
+
+    Returns:
+        pd.DataFrame: simulate results with the interval bounds (efficiency_lower,
+        efficiency_upper) and the number of simulated epochs
+    """
+    assert batch_epochs >= 2
+    if bot_params is None:
+        bot_params = BOT_PARAMETERS
+
+    rng = np.random.default_rng(seed)
+    z = normal_quantile(confidence)
+    simulation = BatchSimulation(solar_model, Bot(**bot_params, step_hours=solar_model.step_minutes / 60),
+                                 power_systems)
+    statistics = RunningStatistics(len(power_systems))
+    satisfied = np.zeros(len(power_systems), dtype=np.int64)
+
+    while statistics.count[0] < max_epochs:
+        _satisfied = simulation.run_per_epoch(min(batch_epochs, max_epochs - statistics.count[0]), rng)
+        satisfied += _satisfied.sum(axis=1)
+        statistics.update(100 * _satisfied / len(simulation.seasons))
+
+        _lower, _upper = statistics.interval(z)
+        if statistics.count[0] >= 2 and (_upper - _lower < target_width).all():
+            break
+
+    epochs = int(statistics.count[0])
+    activities = [[int(_satisfied), epochs * len(simulation.seasons)] for _satisfied in satisfied]
+
+    results = results_frame(power_systems, activities)
+    results["efficiency_lower"], results["efficiency_upper"] = statistics.interval(z)
+    results["epochs"] = epochs
+    return results
+
+
+def results_frame(power_systems: List[PowerSystem], activities: List[List[int]]) -> pd.DataFrame:
+    """
+    Gathers simulation results of each power system.
+
+    Args:
+        power_systems (List[PowerSystem]): simulated power systems
+        activities (List[List[int]]): [satisfied hours, simulated hours] of each power system
+
+    Returns:
+        pd.DataFrame: one row per power system
+    """
+    return pd.DataFrame({
+        "system": np.arange(1, len(power_systems) + 1),
+        "solar_area": [_ps.solar_area for _ps in power_systems],
+        "solar_efficiency": [_ps.solar_efficiency for _ps in power_systems],
+        "battery_capacity": [_ps.max_battery_capacity for _ps in power_systems],
+        "satisfied_hours": [_a[0] for _a in activities],
+        "simulated_hours": [_a[1] for _a in activities],
+        "user_efficiency": [100 * _a[0] / _a[1] for _a in activities],
+        "carbon_footprint": [_ps.get_carbon_footprint() for _ps in power_systems]
+    })
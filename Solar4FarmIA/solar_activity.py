@@ -1,8 +1,15 @@
-import pandas as pd
 from typing import Tuple
+import copy
 import numpy as np
-import sys
-from const import TEMPERATURE_STATE_NUMBER, IRRADIANCE_STATE_NUMBER
+from const import TEMPERATURE_STATE_NUMBER, IRRADIANCE_STATE_NUMBER, \
+            SEASON_NUMBER, MONTH_TO_SEASON, STEP_MINUTES
+from solar_dataset import CHUNK_SIZE, StepResampler, read_nsrdb_chunks, read_nsrdb_tail, nsrdb_bounds, \
+            nsrdb_step_minutes, nsrdb_complete_size
+from transitions import SparseTransitions
+from sampling import AliasTables
+
+
+OUT_OF_RANGE_POLICIES = ("clip", "drop", "error") # handling of new rows out of the fitted ranges
 
 
 class SolarActivity():
@@ -16,144 +23,554 @@ class SolarActivity():
 
     Attributes:
         __current_state (Tuple[float, float]): current state (temperature, irradiance)
-        __summer_transition_matrix (np.matrix): transition matrix for summer season
-        __spring_transition_matrix (np.matrix): transition matrix for spring season
-        __fall_transition_matrix (np.matrix): transition matrix for fall season
-        __winter_transition_matrix (np.matrix): transition matrix for winter season
+        __transition_matrices (np.ndarray): transition matrices of shape (season, N, N)
+        __cdf_tables (np.ndarray): row-wise cumulative transition matrices of shape (season, N, N)
+        __transitions (SparseTransitions): compact transition model of sparse models, None otherwise
+        __counts (np.ndarray): raw transition counts of shape (season, N, N) of fitted dense models
         Tmin (float): minimal temperature
         Tmax (float): maximal temperature
         Rmin (float): minimal irradiance
         Rmax (float): maximal irradiance
         dT (float): temperature discrete step
         dR (float): irradiance discrete step
+        sampler (str): "cdf" (bisection in cumulative tables) or "alias" (alias tables, O(1))
+        dataset_offset (int): size of the fitted lines of the dataset, where update_from_csv resumes
+        step_minutes (int): simulation step length in minutes
+        transition_minutes (int): minutes between two transitions of the tables, a multiple of step_minutes
+        temperature_states (int): number of discrete temperature states
+        irradiance_states (int): number of discrete irradiance states
+        N (int): state number
+        rng (np.random.Generator): random generator used for transitions
     """
-    def __init__(self, initial_state: Tuple[float, float], solar_dataset: str = "data/solar_data.csv") -> None:
+    def __init__(self,
+                 initial_state: Tuple[float, float],
+                 solar_dataset: str = "data/solar_data.csv",
+                 rng: np.random.Generator = None,
+                 bounds: Tuple[float, float, float, float] = None,
+                 chunksize: int = CHUNK_SIZE,
+                 temperature_states: int = TEMPERATURE_STATE_NUMBER,
+                 irradiance_states: int = IRRADIANCE_STATE_NUMBER,
+                 sparse: bool = False,
+                 dtype: type = np.float64,
+                 sampler: str = "cdf",
+                 step_minutes: int = STEP_MINUTES,
+                 data_minutes: int = None) -> None:
         """
         SolarActivity constructor allows to build transition matrcies for each season
         based on solar_dataset. Initilisez __curent_state to initial_state.
+        The dataset is streamed by chunks, so memory does not grow with its size:
+        a first pass finds temperature and irradiance ranges (skipped when bounds
+        are supplied, values out of them go to the closest state), a second one
+        counts the transitions.
+        Sparse models only keep the observed transitions (see SparseTransitions),
+        which allows fine discretizations whose dense matrices would not fit in
+        memory; dense tables are then only built on demand.
+        Transitions are counted between rows of the dataset resolution or of
+        step_minutes when it is a multiple of it (finer rows are subsampled, see
+        StepResampler). Steps shorter than the dataset resolution are not fitted on
+        interpolated rows, which would make a different chain: the state fitted at
+        the dataset resolution is held during transition_minutes // step_minutes
+        steps, so sub-hourly runs on hourly data keep the hourly weather and only
+        refine the batteries and the bot.
 
         Args:
             initial_state (Tuple[int, int]): Initial solar temperature and 
             solar_dataset (str): Solar dataset file. Defaults to solar_data_2018.csv
+            rng (np.random.Generator, optional): random generator. Defaults to
+            the global numpy.random state.
+            bounds (Tuple[float, float, float, float], optional): Tmin, Tmax, Rmin, Rmax.
+            Defaults to the ranges of the dataset.
+            chunksize (int, optional): number of rows read at once. Defaults to CHUNK_SIZE.
+            temperature_states (int, optional): discrete temperature states. Defaults to TEMPERATURE_STATE_NUMBER.
+            irradiance_states (int, optional): discrete irradiance states. Defaults to IRRADIANCE_STATE_NUMBER.
+            sparse (bool, optional): keep observed transitions only. Defaults to False.
+            dtype (type, optional): type of the probabilities, e.g. np.float32. Defaults to np.float64.
+            sampler (str, optional): "cdf" or "alias" sampling of dense models. Defaults to "cdf".
+            step_minutes (int, optional): simulation step length in minutes. Defaults to STEP_MINUTES.
+            data_minutes (int, optional): minutes between two dataset rows. Defaults to the
+            resolution read from the dataset.
+
+        Raises:
+            ValueError: step_minutes is neither a multiple nor a divisor of the dataset resolution,
+            or a month of the dataset is not in 1..12
         """
+        if data_minutes is None:
+            data_minutes = nsrdb_step_minutes(solar_dataset)
+        if step_minutes % data_minutes != 0 and data_minutes % step_minutes != 0:
+            raise ValueError(f"A {step_minutes} minutes step cannot be simulated from {data_minutes} minutes "
+                             f"data, use a multiple or a divisor of the data resolution")
+        self.step_minutes = step_minutes
+        self.transition_minutes = max(step_minutes, data_minutes)
+        self.__resampler = StepResampler(data_minutes, self.transition_minutes)
+        self.__held_steps = 0 # steps the current state was used since its transition
+        _size = nsrdb_complete_size(solar_dataset) # a last line being written is left to update_from_csv
+
         self.__current_state = initial_state
-        solar_df = pd.read_csv(solar_dataset)
-        months = np.array(list(map(lambda x: int(x), solar_df["Location ID"].to_list()[2:])))
-        # day = np.array(list(map(lambda x: int(x), solar_df["City"].to_list()[2:]))) # uncomment to use days
-        # hours = np.array(list(map(lambda x: int(x), solar_df["State"].to_list()[2:]))) # uncomment to use hours 
-        temperatures = np.array(list(map(lambda x: float(x), solar_df["Longitude"].to_list()[2:])))
-        irradiances = np.array(list(map(lambda x: float(x), solar_df["Latitude"].to_list()[2:])))
-
-        self.Tmin, self.Tmax = temperatures.min(), temperatures.max()
-        self.Rmin, self.Rmax = irradiances.min(), irradiances.max()
-
-        self.dT = (self.Tmax - self.Tmin) / TEMPERATURE_STATE_NUMBER # discrete step of temperature
-        self.dR = (self.Rmax - self.Rmin) / IRRADIANCE_STATE_NUMBER # discrete step of irradiance
-
-        self.N = (TEMPERATURE_STATE_NUMBER * IRRADIANCE_STATE_NUMBER) # state number
-
-        self.__summer_transition_matrix = np.ones((self.N, self.N))
-        self.__spring_transition_matrix = np.ones((self.N, self.N))
-        self.__fall_transition_matrix = np.ones((self.N, self.N))
-        self.__winter_transition_matrix = np.ones((self.N, self.N))
-
-
-        for i in range(len(temperatures) - 1):
-            j = int((temperatures[i] - self.Tmin) / self.dT)
-            k = int((irradiances[i] - self.Rmin) / self.dR)
-            s = int((temperatures[i+1] - self.Tmin) / self.dT)
-            t = int((irradiances[i+1] - self.Rmin) / self.dR)
-
-            if j == TEMPERATURE_STATE_NUMBER: # decrement for maximal value as it exceeds the range
-                j -= 1
-            if k == IRRADIANCE_STATE_NUMBER:
-                k -= 1
-            if s == TEMPERATURE_STATE_NUMBER:
-                s -= 1
-            if t == IRRADIANCE_STATE_NUMBER:
-                t -= 1
-
-            month = months[i]
-
-            _from_state = j*IRRADIANCE_STATE_NUMBER + k
-            _to_state = s*IRRADIANCE_STATE_NUMBER + t
-
-            if month == 12 or 1 <= month <= 2:
-                self.__winter_transition_matrix[_from_state][_to_state] += 1
-            elif 3 <= month <= 5:
-                self.__spring_transition_matrix[_from_state][_to_state] += 1
-            elif 6 <= month <= 8:
-                self.__summer_transition_matrix[_from_state][_to_state] += 1
-            elif 9 <= month <= 11:
-                self.__fall_transition_matrix[_from_state][_to_state] += 1
+        self.rng = rng if rng is not None else np.random
+        self.sampler = sampler
+        if bounds is None:
+            bounds = nsrdb_bounds(solar_dataset, chunksize, _size)
+        self.Tmin, self.Tmax, self.Rmin, self.Rmax = bounds
+
+        self.temperature_states = temperature_states
+        self.irradiance_states = irradiance_states
+
+        self.dT = (self.Tmax - self.Tmin) / self.temperature_states # discrete step of temperature
+        self.dR = (self.Rmax - self.Rmin) / self.irradiance_states # discrete step of irradiance
+
+        self.N = (self.temperature_states * self.irradiance_states) # state number
+
+        self.__dtype = dtype
+        self.__last = None # season and state of the last counted row
+        if sparse:
+            self.__codes = np.zeros(0, dtype=np.int64) # observed transitions and their counts
+            self.__code_counts = np.zeros(0, dtype=np.int64)
+            self.__counts = None
+        else:
+            self.__codes = None
+            self.__counts = np.zeros((SEASON_NUMBER, self.N, self.N), dtype=np.int64)
+
+        for _chunk in read_nsrdb_chunks(solar_dataset, chunksize, _size):
+            months, temperatures, irradiances = self.__resampler(*_chunk)
+            _transitions = self.__transition_codes(months, temperatures, irradiances, "clip")
+            if sparse:
+                self.__merge_codes(_transitions)
             else:
-                print("Error in transition matrix constrution: month number {month} does not exist")
-                sys.exit(1)
+                self.__counts += np.bincount(_transitions, minlength=self.__counts.size).reshape(self.__counts.shape)
+        self.dataset_offset = _size
+
+        self.__transitions = None
+        self.__transition_matrices = None
+        self.__cdf_tables = None
+        self.__alias_tables = None
+        if sparse:
+            self.__transitions = SparseTransitions(self.__codes, self.__code_counts, SEASON_NUMBER, self.N, dtype)
+            return
+
+        # Laplace smoothing: every transition is seen at least once
+        self.__transition_matrices = (1.0 + self.__counts).astype(dtype)
+        self.__transition_matrices /= self.__transition_matrices.sum(axis=2, keepdims=True)
+
+        # row-wise cumulative distributions used for sampling
+        self.__cdf_tables = np.cumsum(self.__transition_matrices, axis=2)
+
+    @classmethod
+    def from_tables(cls,
+                    initial_state: Tuple[float, float],
+                    transition_matrices: np.ndarray,
+                    cdf_tables: np.ndarray,
+                    bounds: Tuple[float, float, float, float, float, float],
+                    rng: np.random.Generator = None,
+                    sampler: str = "cdf",
+                    step_minutes: int = STEP_MINUTES,
+                    transition_minutes: int = None,
+                    counts: np.ndarray = None,
+                    last_counted: Tuple[int, int] = None,
+                    resampler: StepResampler = None,
+                    dataset_offset: int = None) -> "SolarActivity":
+        """
+        Builds a SolarActivity from already fitted tables (e.g. loaded from a cache)
+        without reading the solar dataset. Models given the raw counts, the last
+        counted row and the resampler position of their fit can be updated with
+        the rows following the fitted ones; read-only tables are then copied.
+
+        Args:
+            initial_state (Tuple[float, float]): Initial solar temperature and irradiance
+            transition_matrices (np.ndarray): transition matrices of shape (season, N, N)
+            cdf_tables (np.ndarray): row-wise cumulative transition matrices of shape (season, N, N)
+            bounds (Tuple[float, float, float, float, float, float]): Tmin, Tmax, Rmin, Rmax, dT, dR
+            rng (np.random.Generator, optional): random generator. Defaults to
+            the global numpy.random state.
+            sampler (str, optional): "cdf" or "alias". Defaults to "cdf".
+            step_minutes (int, optional): simulation step length in minutes. Defaults to STEP_MINUTES.
+            transition_minutes (int, optional): minutes between two transitions of the tables.
+            Defaults to step_minutes.
+            counts (np.ndarray, optional): raw transition counts of shape (season, N, N).
+            Defaults to None, the model cannot be updated.
+            last_counted (Tuple[int, int], optional): season and state of the last counted row.
+            Defaults to None.
+            resampler (StepResampler, optional): resampler of the fitted rows. Defaults to None.
+            dataset_offset (int, optional): size of the fitted lines of the dataset. Defaults to None.
+
+        Returns:
+            SolarActivity: solar activity model
+        """
+        self = cls.__new__(cls)
+        self.__current_state = initial_state
+        self.rng = rng if rng is not None else np.random
+        self.sampler = sampler
+
+        self.Tmin, self.Tmax, self.Rmin, self.Rmax, self.dT, self.dR = bounds
+        self.temperature_states = TEMPERATURE_STATE_NUMBER
+        self.irradiance_states = IRRADIANCE_STATE_NUMBER
+        self.N = (self.temperature_states * self.irradiance_states) # state number
+
+        assert transition_matrices.shape == (SEASON_NUMBER, self.N, self.N)
+        assert cdf_tables.shape == transition_matrices.shape
+
+        self.__transitions = None
+        self.__transition_matrices = transition_matrices
+        self.__cdf_tables = cdf_tables
+        self.__alias_tables = None
+
+        # models built without their raw counts cannot be updated
+        assert counts is None or (counts.shape == transition_matrices.shape and resampler is not None)
+        self.__counts = counts
+        self.__codes = None
+        self.__last = last_counted
+        self.__resampler = resampler
+        self.step_minutes = step_minutes
+        self.transition_minutes = transition_minutes if transition_minutes is not None else step_minutes
+        assert self.transition_minutes % step_minutes == 0, "transitions must last whole steps"
+        self.__held_steps = 0
+        self.__dtype = transition_matrices.dtype
+        self.dataset_offset = dataset_offset
+
+        return self
+
+    @property
+    def current_state(self) -> Tuple[float, float]:
+        """
+        Current (temperature, irradiance) state
+
+        Returns:
+            Tuple[float, float]: current state
+        """
+        return self.__current_state
+
+    @current_state.setter
+    def current_state(self, state: Tuple[float, float]) -> None:
+        self.__current_state = state
+
+    @property
+    def transition_matrices(self) -> np.ndarray:
+        """
+        Transition matrices of each season, indexed by season (see const.py).
+        They are expanded on first access for sparse models.
+
+        Returns:
+            np.ndarray: transition matrices of shape (season, N, N)
+        """
+        if self.__transition_matrices is None:
+            self.__transition_matrices = self.__transitions.dense()
+        return self.__transition_matrices
+
+    @property
+    def cdf_tables(self) -> np.ndarray:
+        """
+        Row-wise cumulative transition matrices of each season.
+        They are expanded on first access for sparse models.
+
+        Returns:
+            np.ndarray: cumulative tables of shape (season, N, N)
+        """
+        if self.__cdf_tables is None:
+            self.__cdf_tables = np.cumsum(self.transition_matrices, axis=2)
+        return self.__cdf_tables
+
+    @property
+    def counts(self) -> np.ndarray:
+        """
+        Raw transition counts of each season, before smoothing
+
+        Returns:
+            np.ndarray: counts of shape (season, N, N), None for models built without them
+        """
+        if self.__counts is None and self.__codes is not None:
+            _counts = np.zeros(SEASON_NUMBER * self.N * self.N, dtype=np.int64)
+            _counts[self.__codes] = self.__code_counts
+            return _counts.reshape((SEASON_NUMBER, self.N, self.N))
+        return self.__counts
+
+    @property
+    def last_counted(self) -> Tuple[int, int]:
+        """
+        Season and state of the last counted row, the origin of the next counted transition
+
+        Returns:
+            Tuple[int, int]: season and state index, None before any row
+        """
+        return None if self.__last is None else (int(self.__last[0]), int(self.__last[1]))
+
+    @property
+    def resampler(self) -> StepResampler:
+        """
+        Resampler of the counted rows, positioned after the last one
+
+        Returns:
+            StepResampler: resampler, None for models built from tables only
+        """
+        return self.__resampler
+
+    @property
+    def alias_tables(self) -> AliasTables:
+        """
+        Alias tables of the transition matrices, built on first access
+
+        Returns:
+            AliasTables: alias tables of each season and state
+        """
+        if self.__alias_tables is None:
+            self.__alias_tables = AliasTables(self.transition_matrices)
+        return self.__alias_tables
+
+    @property
+    def transitions(self) -> SparseTransitions:
+        """
+        Compact transition model
+
+        Returns:
+            SparseTransitions: observed transitions of sparse models, None for dense ones
+        """
+        return self.__transitions
+
+    def __state_indices(self, temperatures: np.ndarray, irradiances: np.ndarray) -> np.ndarray:
+        """
+        Discretizes whole columns of temperatures and irradiances into state indices.
+
+        Args:
+            temperatures (np.ndarray): temperatures
+            irradiances (np.ndarray): irradiances
+
+        Returns:
+            np.ndarray: state indices
+        """
+        j = ((temperatures - self.Tmin) / self.dT).astype(int)
+        k = ((irradiances - self.Rmin) / self.dR).astype(int)
+
+        # decrement for maximal value as it exceeds the range
+        np.clip(j, 0, self.temperature_states - 1, out=j)
+        np.clip(k, 0, self.irradiance_states - 1, out=k)
+
+        return j * self.irradiance_states + k
+
+    def update(self,
+               months: np.ndarray,
+               temperatures: np.ndarray,
+               irradiances: np.ndarray,
+               policy: str = "clip") -> int:
+        """
+        Adds new rows, following the fitted ones at the dataset resolution, to the
+        transition counts (they are resampled to transition_minutes like during the fit).
+        Only the rows of the touched states are normalized again, so the cost grows
+        with the new rows and not with the fitted archive (sparse models rebuild their
+        compact tables). Bins stay fixed: with the "clip" policy, values out of
+        Tmin..Tmax or Rmin..Rmax go to the closest state, like during the fit; with
+        "drop", out of range rows are ignored together with the transitions from and
+        to them; with "error", they raise a ValueError and nothing is updated.
+
+        Args:
+            months (np.ndarray): months of the new rows
+            temperatures (np.ndarray): temperatures of the new rows
+            irradiances (np.ndarray): irradiances of the new rows
+            policy (str, optional): one of OUT_OF_RANGE_POLICIES. Defaults to "clip".
+
+        Raises:
+            ValueError: a month is not in 1..12, or rows are out of the fitted ranges with the "error" policy
+
+        Returns:
+            int: number of counted transitions
+        """
+        assert self.__counts is not None or self.__codes is not None, \
+            "models built without their counts cannot be updated"
+
+        _resampler = copy.copy(self.__resampler) # kept unchanged when rows are rejected
+        months, temperatures, irradiances = _resampler(np.asarray(months),
+                                                       np.asarray(temperatures, dtype=float),
+                                                       np.asarray(irradiances, dtype=float))
+        _transitions = self.__transition_codes(months, temperatures, irradiances, policy)
+        self.__resampler = _resampler
+        if len(_transitions) == 0:
+            return 0
+        self.__alias_tables = None
+
+        if self.__counts is None:
+            self.__merge_codes(_transitions)
+            self.__transitions = SparseTransitions(self.__codes, self.__code_counts, SEASON_NUMBER, self.N,
+                                                   self.__dtype)
+            self.__transition_matrices = None
+            self.__cdf_tables = None
+            return len(_transitions)
+
+        if not self.__transition_matrices.flags.writeable: # memory-mapped cache entries
+            self.__transition_matrices = np.array(self.__transition_matrices)
+            self.__cdf_tables = np.array(self.__cdf_tables)
+        np.add.at(self.__counts.reshape(-1), _transitions, 1)
+
+        _rows = np.unique(_transitions // self.N)
+        _matrices = (1.0 + self.__counts.reshape((-1, self.N))[_rows]).astype(self.__dtype)
+        _matrices /= _matrices.sum(axis=1, keepdims=True)
+        self.__transition_matrices.reshape((-1, self.N))[_rows] = _matrices
+        self.__cdf_tables.reshape((-1, self.N))[_rows] = np.cumsum(_matrices, axis=1)
+
+        return len(_transitions)
+
+    def update_from_csv(self, solar_dataset: str, offset: int = None, policy: str = "clip") -> int:
+        """
+        Adds the rows appended to an NSRDB csv file since the last fit or update.
+        Only the new tail of the file is read.
+
+        Args:
+            solar_dataset (str): solar dataset file
+            offset (int, optional): byte offset of the first new row. Defaults to dataset_offset.
+            policy (str, optional): one of OUT_OF_RANGE_POLICIES. Defaults to "clip".
+
+        Returns:
+            int: number of counted transitions
+        """
+        if offset is None:
+            offset = self.dataset_offset
+        assert offset is not None, "the offset of the new rows is unknown"
+
+        months, temperatures, irradiances, _end = read_nsrdb_tail(solar_dataset, offset)
+        _counted = self.update(months, temperatures, irradiances, policy)
+        self.dataset_offset = _end
+        return _counted
+
+    def __transition_codes(self,
+                           months: np.ndarray,
+                           temperatures: np.ndarray,
+                           irradiances: np.ndarray,
+                           policy: str) -> np.ndarray:
+        """
+        Discretizes consecutive rows, chained to the last counted row, into transition
+        codes (season * N + state) * N + next state.
+
+        Args:
+            months (np.ndarray): months
+            temperatures (np.ndarray): temperatures
+            irradiances (np.ndarray): irradiances
+            policy (str): one of OUT_OF_RANGE_POLICIES
+
+        Raises:
+            ValueError: a month is not in 1..12, or rows are out of the fitted ranges with the "error" policy
 
-        winter_cols_sums = self.__winter_transition_matrix.sum(axis=1)
-        spring_cols_sums = self.__spring_transition_matrix.sum(axis=1)
-        fall_cols_sums = self.__fall_transition_matrix.sum(axis=1)
-        summer_cols_sums = self.__summer_transition_matrix.sum(axis=1)
+        Returns:
+            np.ndarray: transition codes
+        """
+        assert policy in OUT_OF_RANGE_POLICIES
+        if len(months) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        _invalid = (months < 1) | (months > 12)
+        if _invalid.any():
+            raise ValueError(f"Month number {months[_invalid][0]} does not exist")
+        seasons = np.array(MONTH_TO_SEASON)[months]
+        _states = self.__state_indices(temperatures, irradiances)
+
+        _valid = np.ones(len(_states), dtype=bool)
+        if policy != "clip":
+            _valid = (temperatures >= self.Tmin) & (temperatures <= self.Tmax) & \
+                     (irradiances >= self.Rmin) & (irradiances <= self.Rmax)
+            if policy == "error" and not _valid.all():
+                raise ValueError(f"{np.count_nonzero(~_valid)} rows are out of the fitted ranges")
+
+        if self.__last is not None: # transition from the last counted row
+            seasons = np.concatenate(([self.__last[0]], seasons))
+            _states = np.concatenate(([self.__last[1]], _states))
+            _valid = np.concatenate(([True], _valid))
+        self.__last = (seasons[-1], _states[-1]) if _valid[-1] else None
 
-        for i in range(self.N):
-            for j in range(self.N):
-                self.__winter_transition_matrix[i][j] /= winter_cols_sums[i]
-                self.__spring_transition_matrix[i][j] /= spring_cols_sums[i]
-                self.__fall_transition_matrix[i][j] /= fall_cols_sums[i]
-                self.__summer_transition_matrix[i][j] /= summer_cols_sums[i]
+        _transitions = (seasons[:-1] * self.N + _states[:-1]) * self.N + _states[1:]
+        if policy == "drop":
+            _transitions = _transitions[_valid[:-1] & _valid[1:]]
+        return _transitions
+
+    def __merge_codes(self, transitions: np.ndarray) -> None:
+        """
+        Merges transition codes into the observed transitions of sparse models.
+
+        Args:
+            transitions (np.ndarray): transition codes
+        """
+        _new_codes, _new_counts = np.unique(transitions, return_counts=True)
+        self.__codes, _inverse = np.unique(np.concatenate((self.__codes, _new_codes)), return_inverse=True)
+        self.__code_counts = np.bincount(_inverse, np.concatenate((self.__code_counts, _new_counts)),
+                                         len(self.__codes)).astype(np.int64)
 
     def next_step(self, month: int) -> Tuple[float, float]:
         """
-        A function to be called to return current state and transit to the next state
+        A function to be called to return current state and transit to the next state.
+        When steps are shorter than transitions, the state transits once every
+        transition_minutes // step_minutes calls.
+
+        Args:
+            month (int): a month of the year
+
+        Raises:
+            ValueError: month is not in 1..12
 
         Returns:
             Tuple[float, float]: current state
         """
         _st = self.__current_state 
-        self.__next_state(month)
+        self.__held_steps += 1
+        if self.__held_steps * self.step_minutes == self.transition_minutes:
+            self.__held_steps = 0
+            self.__next_state(month)
         return _st
 
-    def __next_state(self, month: int) -> None:
+    def state_index(self, state: Tuple[float, float]) -> int:
         """
-        Transits __current_state to a new state using the transition matrices 
-        corresponding to the season.
+        Returns the discrete state index of a (temperature, irradiance) state
 
         Args:
-            month (int): a month of the year
+            state (Tuple[float, float]): solar state
+
+        Returns:
+            int: state index
         """
-        j = int((self.__current_state[0] - self.Tmin) / self.dT)
-        k = int((self.__current_state[1] - self.Rmin) / self.dR)
+        j = int((state[0] - self.Tmin) / self.dT)
+        k = int((state[1] - self.Rmin) / self.dR)
 
-        if j == TEMPERATURE_STATE_NUMBER: # decrement for maximal value as it exceeds the range
+        if j == self.temperature_states: # decrement for maximal value as it exceeds the range
             j -= 1
-        if k == IRRADIANCE_STATE_NUMBER:
+        if k == self.irradiance_states:
             k -= 1
 
-        _st = j * IRRADIANCE_STATE_NUMBER + k
-        h = np.random.uniform(0.0, 1.0)
-        acc = 0.0
-        _new_st = 0
-
-        for l in range(self.N-1):
-            _tmp_trans = 0.0
-            if month == 12 or 1 <= month <= 2:
-                _tmp_trans = self.__winter_transition_matrix[_st][l]
-            elif 3 <= month <= 5:
-                _tmp_trans = self.__spring_transition_matrix[_st][l]
-            elif 6 <= month <= 8:
-                _tmp_trans = self.__summer_transition_matrix[_st][l]
-            elif 9 <= month <= 11:
-                _tmp_trans = self.__fall_transition_matrix[_st][l]
-            else:
-                print("Error in transition matrix constrution: month number {month} does not exist")
-                sys.exit(1)
-            if acc <= h <= acc + _tmp_trans:
-                _new_st = l
-                break
+        return j * self.irradiance_states + k
+
+    def state_value(self, index: int) -> Tuple[float, float]:
+        """
+        Returns the (temperature, irradiance) state of a discrete state index
+
+        Args:
+            index (int): state index
+
+        Returns:
+            Tuple[float, float]: solar state
+        """
+        _j = int(index / self.irradiance_states)
+        _k = index % self.irradiance_states
 
-            acc += _tmp_trans
+        return (self.Tmin + _j * self.dT, self.Rmin + _k * self.dR)
+
+    def __next_state(self, month: int) -> None:
+        """
+        Transits __current_state to a new state using the cumulative transition
+        table corresponding to the season. The new state is the first state whose
+        cumulative probability reaches the uniform draw. The last state, which the
+        former linear scan could never select, is reached when the draw exceeds
+        every other cumulative probability. Sparse models sample their observed
+        transitions instead, and the alias sampler uses alias tables.
+
+        Args:
+            month (int): a month of the year
+
+        Raises:
+            ValueError: month is not in 1..12
+        """
+        if not 1 <= month <= 12:
+            raise ValueError(f"Month number {month} does not exist")
 
-        _j = int(_new_st / IRRADIANCE_STATE_NUMBER)
-        _k = _new_st % IRRADIANCE_STATE_NUMBER
+        _st = self.state_index(self.__current_state)
+        h = self.rng.uniform(0.0, 1.0)
+        if self.__transitions is not None:
+            _new_st = self.__transitions.sample(MONTH_TO_SEASON[month], _st, h)
+        elif self.sampler == "alias":
+            _new_st = self.alias_tables.sample(MONTH_TO_SEASON[month], _st, h)
+        else:
+            _cdf = self.__cdf_tables[MONTH_TO_SEASON[month], _st]
+            _new_st = min(int(np.searchsorted(_cdf, h)), self.N - 1)
 
-        self.__current_state = (self.Tmin + _j * self.dT, self.Rmin + _k * self.dR)
\ No newline at end of file
+        self.__current_state = self.state_value(_new_st)
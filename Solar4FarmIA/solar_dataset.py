@@ -0,0 +1,262 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+from typing import Iterator, Tuple
+
+try:
+    from pyarrow import csv as pa_csv
+except ImportError: # pyarrow is optional, pandas is used otherwise
+    pa_csv = None
+
+
+CHUNK_SIZE = 1 << 16 # number of rows read at once
+HEADER_ROWS = 2 # NSRDB metadata rows before the column names
+
+# position of the columns used in NSRDB csv files
+MONTH_COLUMN = 1
+HOUR_COLUMN = 3
+MINUTE_COLUMN = 4
+IRRADIANCE_COLUMN = 5 # DNI
+TEMPERATURE_COLUMN = 6
+
+
+def nsrdb_columns(solar_dataset: str) -> Tuple[str, str, str]:
+    """
+    Reads the names of the month, temperature and irradiance columns, which
+    follow the 2 metadata rows of NSRDB csv files.
+
+    Args:
+        solar_dataset (str): solar dataset file
+
+    Returns:
+        Tuple[str, str, str]: month, temperature and irradiance column names
+    """
+    with open(solar_dataset) as f:
+        for _ in range(HEADER_ROWS):
+            f.readline()
+        _names = f.readline().strip().split(",")
+    return _names[MONTH_COLUMN], _names[TEMPERATURE_COLUMN], _names[IRRADIANCE_COLUMN]
+
+
+def nsrdb_step_minutes(solar_dataset: str) -> int:
+    """
+    Reads the time resolution of an NSRDB csv file from its first two rows.
+
+    Args:
+        solar_dataset (str): solar dataset file
+
+    Returns:
+        int: minutes between two rows, 60 when the file has less than two rows
+    """
+    with open(solar_dataset) as f:
+        for _ in range(HEADER_ROWS + 1):
+            f.readline()
+        _rows = [f.readline().split(",") for _ in range(2)]
+    if len(_rows[1]) <= MINUTE_COLUMN:
+        return 60
+    _first, _second = [int(_r[HOUR_COLUMN]) * 60 + int(_r[MINUTE_COLUMN]) for _r in _rows]
+    return (_second - _first) % (24 * 60) or 24 * 60
+
+
+def nsrdb_complete_size(solar_dataset: str) -> int:
+    """
+    Computes the byte size of the complete lines of a csv file: a last line
+    without its end of line may still be written, and is left for later.
+
+    Args:
+        solar_dataset (str): solar dataset file
+
+    Returns:
+        int: byte offset following the last end of line
+    """
+    with open(solar_dataset, "rb") as f:
+        _end = f.seek(0, os.SEEK_END)
+        while _end > 0:
+            _start = max(0, _end - (1 << 16))
+            f.seek(_start)
+            _last = f.read(_end - _start).rfind(b"\n")
+            if _last >= 0:
+                return _start + _last + 1
+            _end = _start
+    return 0
+
+
+class HeadReader(io.RawIOBase):
+    """
+    Binary file reader stopping after the first bytes of a file.
+
+    Attributes:
+        left (int): bytes left to read
+    """
+
+    def __init__(self, path: str, size: int) -> None:
+        """
+        Args:
+            path (str): read file
+            size (int): number of readable bytes
+        """
+        self.__file = open(path, "rb", buffering=0)
+        self.left = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        _read = self.__file.readinto(memoryview(buffer)[:self.left])
+        self.left -= _read
+        return _read
+
+    def close(self) -> None:
+        self.__file.close()
+        super().close()
+
+
+class StepResampler():
+    """
+    Resamples consecutive NSRDB rows from the dataset resolution to a longer
+    transition step, chunk after chunk, by keeping one row per step. The position
+    in the step is kept between chunks, so that chunked and whole reads give the
+    same rows. Rows are never interpolated to a shorter step (see SolarActivity).
+
+    Attributes:
+        data_minutes (int): minutes between two dataset rows
+        step_minutes (int): minutes between two resampled rows
+        position (int): rows read since the last kept row
+    """
+
+    def __init__(self, data_minutes: int, step_minutes: int, position: int = 0) -> None:
+        """
+        Args:
+            data_minutes (int): minutes between two dataset rows
+            step_minutes (int): minutes between two resampled rows
+            position (int, optional): rows read since the last kept row. Defaults to 0.
+
+        Raises:
+            ValueError: step_minutes is not a multiple of data_minutes
+        """
+        if step_minutes % data_minutes != 0:
+            raise ValueError(f"{data_minutes} minutes rows cannot be resampled to {step_minutes} minutes steps")
+        self.data_minutes = data_minutes
+        self.step_minutes = step_minutes
+        self.position = position
+
+    def __call__(self,
+                 months: np.ndarray,
+                 temperatures: np.ndarray,
+                 irradiances: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Resamples the rows following the previous ones.
+
+        Args:
+            months (np.ndarray): months
+            temperatures (np.ndarray): temperatures
+            irradiances (np.ndarray): irradiances
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: resampled months, temperatures and irradiances
+        """
+        _factor = self.step_minutes // self.data_minutes
+        if _factor == 1:
+            return months, temperatures, irradiances
+        _kept = (self.position + np.arange(len(months))) % _factor == 0
+        self.position = (self.position + len(months)) % _factor
+        return months[_kept], temperatures[_kept], irradiances[_kept]
+
+
+def read_nsrdb_chunks(solar_dataset: str,
+                      chunksize: int = CHUNK_SIZE,
+                      size: int = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Streams an NSRDB csv file by chunks of typed columns, with the pyarrow
+    csv reader when it is installed and pandas otherwise.
+
+    Args:
+        solar_dataset (str): solar dataset file
+        chunksize (int, optional): number of rows per chunk. Defaults to CHUNK_SIZE.
+        size (int, optional): number of read bytes, e.g. nsrdb_complete_size. Defaults to the whole file.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: months, temperatures and irradiances
+    """
+    _month, _temperature, _irradiance = nsrdb_columns(solar_dataset)
+    _types = {_month: "int64", _temperature: "float64", _irradiance: "float64"}
+    _source = solar_dataset if size is None else io.BufferedReader(HeadReader(solar_dataset, size))
+
+    try:
+        if pa_csv is not None:
+            # pyarrow blocks are sized in bytes, rows are about 32 bytes long
+            _reader = pa_csv.open_csv(_source,
+                                      read_options=pa_csv.ReadOptions(skip_rows=HEADER_ROWS,
+                                                                      block_size=32 * chunksize),
+                                      convert_options=pa_csv.ConvertOptions(column_types=_types,
+                                                                            include_columns=list(_types)))
+            for _batch in _reader:
+                if _batch.num_rows == 0:
+                    continue
+                yield (_batch.column(_month).to_numpy(),
+                       _batch.column(_temperature).to_numpy(),
+                       _batch.column(_irradiance).to_numpy())
+        else:
+            _chunks = pd.read_csv(_source,
+                                  skiprows=HEADER_ROWS,
+                                  usecols=list(_types),
+                                  dtype=_types,
+                                  float_precision="round_trip", # same values as pyarrow and float()
+                                  chunksize=chunksize)
+            for _chunk in _chunks:
+                yield (_chunk[_month].to_numpy(),
+                       _chunk[_temperature].to_numpy(),
+                       _chunk[_irradiance].to_numpy())
+    finally:
+        if size is not None:
+            _source.close()
+
+
+def nsrdb_bounds(solar_dataset: str,
+                 chunksize: int = CHUNK_SIZE,
+                 size: int = None) -> Tuple[float, float, float, float]:
+    """
+    Computes temperature and irradiance ranges of an NSRDB csv file in one streaming pass.
+
+    Args:
+        solar_dataset (str): solar dataset file
+        chunksize (int, optional): number of rows per chunk. Defaults to CHUNK_SIZE.
+        size (int, optional): number of read bytes. Defaults to the whole file.
+
+    Returns:
+        Tuple[float, float, float, float]: Tmin, Tmax, Rmin, Rmax
+    """
+    Tmin, Tmax, Rmin, Rmax = np.inf, -np.inf, np.inf, -np.inf
+
+    for _, temperatures, irradiances in read_nsrdb_chunks(solar_dataset, chunksize, size):
+        Tmin, Tmax = min(Tmin, temperatures.min()), max(Tmax, temperatures.max())
+        Rmin, Rmax = min(Rmin, irradiances.min()), max(Rmax, irradiances.max())
+
+    return Tmin, Tmax, Rmin, Rmax
+
+
+def read_nsrdb_tail(solar_dataset: str, offset: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Reads the rows appended to an NSRDB csv file after a byte offset, so that only
+    new rows are parsed. A last line without its end of line is left for later.
+
+    Args:
+        solar_dataset (str): solar dataset file
+        offset (int): byte offset of the first unread row
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, int]: months, temperatures, irradiances
+        and the byte offset following the last read row
+    """
+    with open(solar_dataset, "rb") as f:
+        f.seek(offset)
+        _tail = f.read()
+    _tail = _tail[:_tail.rfind(b"\n") + 1]
+
+    _rows = [_line.split(b",") for _line in _tail.splitlines() if _line.strip()]
+    months = np.array([int(_r[MONTH_COLUMN]) for _r in _rows], dtype=np.int64)
+    temperatures = np.array([float(_r[TEMPERATURE_COLUMN]) for _r in _rows])
+    irradiances = np.array([float(_r[IRRADIANCE_COLUMN]) for _r in _rows])
+
+    return months, temperatures, irradiances, offset + len(_tail)
@@ -0,0 +1,258 @@
+import glob
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+from const import ACTIVE_CURRENT, PASSIVE_CURRENT, BOT_PARAMETERS, STEP_MINUTES
+from solar_activity import SolarActivity
+from power_system import PowerSystem, PowerSystemBank
+from bot import Bot
+from timer import get_calendar
+from batch_simulation import BatchSimulation
+from simulation import results_frame
+from model_cache import model_digest
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # pyarrow is optional, records are then written to csv parts
+    pa = None
+
+
+CHECKPOINT_EPOCHS = 100 # epochs between two checkpoints, one record part each
+CHECKPOINT_FILE = "checkpoint.json" # checkpoint file of an output folder
+RECORD_COLUMNS = ("epoch", "system", "satisfied_hours", "switches", "energy_drawn")
+
+
+def chunk_records(simulation: BatchSimulation,
+                  epochs: int,
+                  rng: np.random.Generator,
+                  start_epoch: int = 0) -> Dict[str, np.ndarray]:
+    """
+    Simulates epochs independent years in lock-step (see BatchSimulation) and
+    gathers the records of every year.
+
+    Args:
+        simulation (BatchSimulation): simulated power systems, solar activity and bot
+        epochs (int): number of simulated years, one trajectory each
+        rng (np.random.Generator): random generator of the years
+        start_epoch (int, optional): index of the first year. Defaults to 0.
+
+    Returns:
+        Dict[str, np.ndarray]: RECORD_COLUMNS of each year and power system, year by year:
+        satisfied hours, battery switches and energy drawn from the batteries (A.h)
+    """
+    bank = PowerSystemBank.from_power_systems(simulation.power_systems, trajectories=epochs,
+                                              step_hours=simulation.step_hours)
+    satisfied = np.zeros((len(bank), epochs), dtype=np.int64)
+    switches = np.zeros((len(bank), epochs), dtype=np.int64)
+    for _, irradiance, _is_active in simulation.sample_steps(epochs, rng):
+        _on_main = bank.on_main_battery.copy()
+        satisfied += bank.next_step(np.where(_is_active, ACTIVE_CURRENT, PASSIVE_CURRENT), irradiance)
+        switches += bank.on_main_battery != _on_main
+
+    return {"epoch": np.repeat(np.arange(start_epoch, start_epoch + epochs, dtype=np.int64), len(bank)),
+            "system": np.tile(np.arange(1, len(bank) + 1), epochs),
+            "satisfied_hours": satisfied.T.reshape(-1),
+            "switches": switches.T.reshape(-1),
+            "energy_drawn": bank.total_battery_energy.T.reshape(-1)}
+
+
+def run_settings(solar_activity: SolarActivity, bot_params: Dict[str, float], seed: int,
+                 checkpoint_epochs: int = CHECKPOINT_EPOCHS) -> Dict:
+    """
+    Describes what the records of a run depend on besides its power systems,
+    as stored in its checkpoints.
+
+    Args:
+        solar_activity (SolarActivity): fitted solar activity model
+        bot_params (Dict[str, float]): Bot parameters
+        seed (int): random seed of the run
+        checkpoint_epochs (int, optional): years of each chunk. Defaults to CHECKPOINT_EPOCHS.
+
+    Returns:
+        Dict: seed, bot parameters, model digest, step length and chunk length
+    """
+    return {"seed": seed,
+            "bot": {_name: float(_value) for _name, _value in bot_params.items()},
+            "model": model_digest(solar_activity),
+            "step_minutes": solar_activity.step_minutes,
+            "checkpoint_epochs": checkpoint_epochs}
+
+
+def save_checkpoint(path: str, epoch: int, chunk: int, entropy: int, systems: int, settings: Dict = None) -> None:
+    """
+    Writes the progress of a run after epoch years to a json file, atomically.
+
+    Args:
+        path (str): checkpoint file
+        epoch (int): number of simulated years
+        chunk (int): spawn index of the chunk holding the next year
+        entropy (int): entropy of the SeedSequence of the run, the seed or fresh entropy
+        systems (int): number of simulated power systems
+        settings (Dict, optional): settings of the run, see run_settings. Defaults to None.
+    """
+    _checkpoint = {"epoch": epoch, "chunk": chunk, "entropy": str(entropy), "systems": systems, "settings": settings}
+    _fd, _temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(_fd, "w") as f:
+        json.dump(_checkpoint, f)
+    os.replace(_temporary, path)
+
+
+def load_checkpoint(path: str, settings: Dict = None, systems: int = None) -> Tuple[int, int, int]:
+    """
+    Reads the progress of a run from a checkpoint file.
+
+    Args:
+        path (str): checkpoint file
+        settings (Dict, optional): settings of the resumed run, see run_settings. Defaults to None.
+        systems (int, optional): number of power systems of the resumed run. Defaults to None.
+
+    Raises:
+        ValueError: the checkpoint was written by a run of other settings or power systems
+
+    Returns:
+        Tuple[int, int, int]: number of simulated years, spawn index of the chunk holding
+        the next year and entropy of the SeedSequence of the run
+    """
+    with open(path) as f:
+        _checkpoint = json.load(f)
+
+    _written = _checkpoint.get("settings") or {}
+    _changed = [_name for _name, _value in (settings or {}).items() if _written.get(_name) != _value]
+    if _changed:
+        raise ValueError(f"{path} was written by a run of another {', '.join(_changed)}, "
+                         f"resume it with the same settings or use another output folder")
+    if systems is not None and _checkpoint["systems"] != systems:
+        raise ValueError(f"{path} was written for {_checkpoint['systems']} power systems, not {systems}")
+    return _checkpoint["epoch"], _checkpoint["chunk"], int(_checkpoint["entropy"])
+
+
+def write_part(output: str, start_epoch: int, records: List[Dict[str, np.ndarray]]) -> str:
+    """
+    Writes the records of consecutive years to a part of an output folder, a
+    parquet file (csv without pyarrow) named after its first year, atomically.
+    Rewriting the same years replaces the part.
+
+    Args:
+        output (str): output folder
+        start_epoch (int): first year of the records
+        records (List[Dict[str, np.ndarray]]): records of consecutive years (see chunk_records)
+
+    Returns:
+        str: part file
+    """
+    _columns = {_c: np.concatenate([_r[_c] for _r in records]) for _c in RECORD_COLUMNS}
+    _extension = ".parquet" if pa is not None else ".csv"
+    path = os.path.join(output, f"part-{start_epoch:09d}{_extension}")
+
+    _fd, _temporary = tempfile.mkstemp(dir=output, suffix=".tmp")
+    os.close(_fd)
+    if pa is not None:
+        pq.write_table(pa.table(_columns), _temporary)
+    else:
+        pd.DataFrame(_columns).to_csv(_temporary, index=False)
+    os.replace(_temporary, path)
+    return path
+
+
+def read_records(output: str) -> pd.DataFrame:
+    """
+    Args:
+        output (str): output folder of run_streaming
+
+    Returns:
+        pd.DataFrame: records of every simulated year, in year order
+    """
+    _parts = sorted(glob.glob(os.path.join(output, "part-*.parquet")) + glob.glob(os.path.join(output, "part-*.csv")))
+    if not _parts:
+        return pd.DataFrame({_c: pd.Series(dtype=float) for _c in RECORD_COLUMNS})
+    return pd.concat([pd.read_parquet(_p) if _p.endswith(".parquet") else pd.read_csv(_p) for _p in _parts],
+                     ignore_index=True)
+
+
+def records_results(power_systems: List[PowerSystem],
+                    records: pd.DataFrame,
+                    step_minutes: int = STEP_MINUTES) -> pd.DataFrame:
+    """
+    Gathers streamed records into simulate results.
+
+    Args:
+        power_systems (List[PowerSystem]): simulated power systems
+        records (pd.DataFrame): records of the power systems (see read_records)
+        step_minutes (int, optional): step length of the run. Defaults to STEP_MINUTES.
+
+    Returns:
+        pd.DataFrame: one row per power system, like simulate
+    """
+    _hours = records["epoch"].nunique() * len(get_calendar(step_minutes).active_steps)
+    _satisfied = records.groupby("system")["satisfied_hours"].sum().reindex(range(1, len(power_systems) + 1),
+                                                                               fill_value=0)
+    return results_frame(power_systems, [[int(_s), _hours] for _s in _satisfied])
+
+
+def run_streaming(power_systems: List[PowerSystem],
+                  solar_model: SolarActivity,
+                  output: str,
+                  epochs: int,
+                  bot_params: Dict[str, float] = None,
+                  seed: int = None,
+                  checkpoint_epochs: int = CHECKPOINT_EPOCHS) -> int:
+    """
+    Simulates epochs years like the batch engine and streams their records to
+    parts of the output folder. Years are simulated in lock-step by chunks of
+    checkpoint_epochs years, chunk k drawing from SeedSequence(seed, spawn_key=(k,))
+    like the trajectories of common random numbers, and each chunk is written to a
+    part followed by a checkpoint of the spawn index of the next chunk. A run started
+    again on the same folder resumes from the last checkpoint: an interrupted run
+    gives the same records as an uninterrupted one, and a finished run can be
+    extended with more epochs (the last chunk is always simulated whole, so a
+    partly written chunk is simulated again and its part rewritten). Checkpoints
+    also keep the seed, the bot parameters, the model digest, the step length and
+    the chunk length, and a run of other settings refuses to resume them.
+    Given objects are not modified.
+
+    Args:
+        power_systems (List[PowerSystem]): simulated power systems
+        solar_model (SolarActivity): fitted solar activity model
+        output (str): output folder, created when needed
+        epochs (int): total number of simulated years
+        bot_params (Dict[str, float], optional): Bot parameters. Defaults to BOT_PARAMETERS.
+        seed (int, optional): random seed of the run. Defaults to fresh entropy, kept in the checkpoints.
+        checkpoint_epochs (int, optional): years of each chunk, between two checkpoints.
+        Defaults to CHECKPOINT_EPOCHS.
+
+    Raises:
+        ValueError: the output folder holds the checkpoint of a run of other settings
+
+    Returns:
+        int: number of simulated years in the output folder
+    """
+    assert checkpoint_epochs >= 1
+    if bot_params is None:
+        bot_params = BOT_PARAMETERS
+    os.makedirs(output, exist_ok=True)
+
+    bot = Bot(**bot_params, step_hours=solar_model.step_minutes / 60)
+    simulation = BatchSimulation(solar_model, bot, power_systems)
+
+    _checkpoint = os.path.join(output, CHECKPOINT_FILE)
+    _settings = run_settings(solar_model, bot_params, seed, checkpoint_epochs)
+    epoch, chunk, entropy = 0, 0, np.random.SeedSequence(seed).entropy
+    if os.path.exists(_checkpoint):
+        epoch, chunk, entropy = load_checkpoint(_checkpoint, _settings, len(power_systems))
+
+    while epoch < epochs:
+        _start = chunk * checkpoint_epochs
+        _rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(chunk,)))
+        _records = chunk_records(simulation, checkpoint_epochs, _rng, _start)
+        _kept = _records["epoch"] < epochs
+        write_part(output, _start, [{_c: _v[_kept] for _c, _v in _records.items()}])
+        epoch = min(_start + checkpoint_epochs, epochs)
+        if epoch == _start + checkpoint_epochs: # a partly written chunk is simulated again
+            chunk += 1
+        save_checkpoint(_checkpoint, epoch, chunk, entropy, len(power_systems), _settings)
+
+    return epoch
@@ -1,23 +1,88 @@
-from const import MONTHS_DAYS
+import functools
+import numpy as np
+from const import MONTHS_DAYS, MONTH_TO_SEASON, ACTIVE_MONTHS_BEGINNING, ACTIVE_MONTHS_FINISHING, \
+            BOT_ACTIVITY_BEGINNING, BOT_ACTIVITY_FINISHING, STEP_MINUTES
 from typing import Tuple
 
 
+class Calendar():
+    """
+        Precomputed calendar of every step of the year, to be indexed
+        directly by simulation loops instead of iterating with Timer.
+        Steps last step_minutes, one hour by default. Arrays are read-only
+        as the calendar is shared.
+
+        Attributes:
+            step_minutes (int): step length in minutes
+            step_hours (float): step length in hours
+            hours (np.ndarray): hour of the day of each step of the year
+            minutes (np.ndarray): minute of the hour of each step of the year
+            days (np.ndarray): day of the year of each step of the year
+            months (np.ndarray): month of each step of the year
+            seasons (np.ndarray): season index of each step of the year
+            active_months (np.ndarray): mask of the simulated months
+            bot_activity (np.ndarray): mask of the bot activity steps
+            steps (List[Tuple[int, int, int]]): (hour, day, month) of each step of the year
+            active_steps (List[Tuple[int, int]]): (hour, month) of each simulated step
+    """
+
+    def __init__(self, step_minutes: int = STEP_MINUTES) -> None:
+        assert step_minutes > 0 and (24 * 60) % step_minutes == 0, "steps must divide a day"
+        _days_number = sum(MONTHS_DAYS)
+        _day_steps = (24 * 60) // step_minutes
+
+        self.step_minutes = step_minutes
+        self.step_hours = step_minutes / 60
+
+        _day_minutes = np.arange(_day_steps) * step_minutes
+        self.hours = np.tile(_day_minutes // 60, _days_number)
+        self.minutes = np.tile(_day_minutes % 60, _days_number)
+        self.days = np.repeat(np.arange(1, _days_number + 1), _day_steps)
+        self.months = np.repeat(np.repeat(np.arange(1, 13), MONTHS_DAYS), _day_steps)
+        self.seasons = np.array(MONTH_TO_SEASON)[self.months]
+
+        self.active_months = (ACTIVE_MONTHS_BEGINNING <= self.months) & (self.months <= ACTIVE_MONTHS_FINISHING)
+        self.bot_activity = (BOT_ACTIVITY_BEGINNING <= self.hours) & (self.hours <= BOT_ACTIVITY_FINISHING)
+
+        for _array in (self.hours, self.minutes, self.days, self.months, self.seasons,
+                       self.active_months, self.bot_activity):
+            _array.flags.writeable = False
+
+        self.steps = list(zip(self.hours.tolist(), self.days.tolist(), self.months.tolist()))
+        self.active_steps = list(zip(self.hours[self.active_months].tolist(),
+                                     self.months[self.active_months].tolist()))
+
+
+@functools.lru_cache(maxsize=None)
+def get_calendar(step_minutes: int = STEP_MINUTES) -> Calendar:
+    """
+    Returns the calendar of a step length, built once per process.
+
+    Args:
+        step_minutes (int, optional): step length in minutes. Defaults to STEP_MINUTES.
+
+    Returns:
+        Calendar: calendar of the year
+    """
+    return Calendar(step_minutes)
+
+
 class Timer():
     """
-        Timer iterator class which allows to count hour by hour
-        during the year keeping track of hours, days and months.
+        Timer iterator class which allows to count step by step (hour by hour
+        by default) during the year keeping track of hours, days and months.
+        It is a view over the precomputed calendar (see get_calendar).
 
         Attributes:
             hour (int): current hour
             day (int): current day
             month (int): current month
-            m_day_counter (int): day counter in current month
-            months_days List[int]: day's number for each month
+            index (int): step of the year of the next step
     """
 
-    def __init__(self) -> None:
-        pass
-    
+    def __init__(self, step_minutes: int = STEP_MINUTES) -> None:
+        self.__steps = get_calendar(step_minutes).steps
+
     def __iter__(self):
         """
         Initializes iterator
@@ -25,10 +90,7 @@ class Timer():
         Returns:
             Timer: timer iterator
         """
-        self.hour = 0
-        self.day = 1
-        self.month = 1
-        self.m_day_counter = 1
+        self.index = 0
         return self
 
     def __next__(self) -> Tuple[int, int, int]:
@@ -39,17 +101,10 @@ class Timer():
         Raises:
             StopIteration: stops the iteration
         """
-        if self.day <= 365:
-            _dt = (self.hour, self.day, self.month)
-            if self.hour >= 23:
-                self.hour = 0
-                self.day += 1
-                self.m_day_counter += 1
-                if self.m_day_counter > MONTHS_DAYS[self.month - 1]:
-                    self.m_day_counter = 1
-                    self.month += 1
-            else:
-                self.hour += 1
+        if self.index < len(self.__steps):
+            _dt = self.__steps[self.index]
+            self.hour, self.day, self.month = _dt
+            self.index += 1
             return _dt
         else:
-            raise StopIteration
\ No newline at end of file
+            raise StopIteration
@@ -0,0 +1,169 @@
+import numpy as np
+from typing import Tuple
+
+
+class SparseTransitions():
+    """
+    Compact transition model of a seasonal Markov chain with Laplace smoothing.
+    Only observed transitions are stored, as CSR rows of counts (one row per season
+    and state); the smoothing term, which gives every transition one pseudo count,
+    is kept analytic. The probability of j after i is
+
+        (count(i, j) + 1) / (total(i) + N)
+
+    so memory grows with the observed transitions instead of N^2. A uniform draw u
+    is inverted in two parts: u * (total(i) + N) below total(i) falls among the
+    observed transitions (bisection in the row, O(log k)), otherwise it selects one
+    of the N states uniformly (O(1)).
+
+    Attributes:
+        N (int): state number
+        seasons (int): season number
+        indptr (np.ndarray): start of each row (season * N + state) in indices, of length seasons * N + 1
+        indices (np.ndarray): observed next states, sorted within each row
+        cumulative (np.ndarray): row-wise cumulative counts of the observed transitions
+        totals (np.ndarray): number of observed transitions of each row
+    """
+
+    def __init__(self, codes: np.ndarray, counts: np.ndarray, seasons: int, n: int, dtype: type = np.float64) -> None:
+        """
+        Builds the CSR rows from the observed transitions.
+
+        Args:
+            codes (np.ndarray): sorted unique transition codes (season * N + i) * N + j
+            counts (np.ndarray): number of observations of each code
+            seasons (int): season number
+            n (int): state number
+            dtype (type, optional): type of the cumulative counts, e.g. np.float32. Defaults to np.float64.
+        """
+        self.N = n
+        self.seasons = seasons
+
+        _rows, _columns = np.divmod(np.asarray(codes, dtype=np.int64), n)
+        self.indptr = np.zeros(seasons * n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(_rows, minlength=seasons * n), out=self.indptr[1:])
+        self.indices = _columns.astype(np.int32)
+
+        _cumulative = np.cumsum(counts, dtype=np.int64)
+        _row_start = np.concatenate(([0], _cumulative))[self.indptr[:-1]]
+        self.totals = (np.concatenate(([0], _cumulative))[self.indptr[1:]] - _row_start).astype(dtype)
+        self.cumulative = (_cumulative - np.repeat(_row_start, np.diff(self.indptr))).astype(dtype)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Returns:
+            int: memory used by the tables in bytes
+        """
+        return self.indptr.nbytes + self.indices.nbytes + self.cumulative.nbytes + self.totals.nbytes
+
+    def sample(self, season: int, state: int, u: float) -> int:
+        """
+        Samples the next state of one chain.
+
+        Args:
+            season (int): season index
+            state (int): current state index
+            u (float): uniform draw in [0, 1)
+
+        Returns:
+            int: next state index
+        """
+        _row = season * self.N + state
+        _total = self.totals[_row]
+        _x = u * (_total + self.N)
+        if _x < _total:
+            _start, _end = self.indptr[_row], self.indptr[_row + 1]
+            return int(self.indices[_start + np.searchsorted(self.cumulative[_start:_end], _x, side="right")])
+        return min(int(_x - _total), self.N - 1)
+
+    def sample_many(self, season: int, states: np.ndarray, uniforms: np.ndarray) -> np.ndarray:
+        """
+        Samples the next state of many chains of the same season at once, with
+        a bisection over all the observed rows at the same time.
+
+        Args:
+            season (int): season index
+            states (np.ndarray): current state index of each chain
+            uniforms (np.ndarray): uniform draw of each chain in [0, 1)
+
+        Returns:
+            np.ndarray: next state index of each chain
+        """
+        _rows = season * self.N + states
+        _total = self.totals[_rows]
+        _x = uniforms * (_total + self.N)
+
+        # first cumulative count above _x (upper bound) in each row
+        lo = self.indptr[_rows]
+        hi = self.indptr[_rows + 1]
+        _width = int((hi - lo).max()) if len(_rows) else 0
+        for _ in range(_width.bit_length()):
+            mid = (lo + hi) // 2
+            _open = lo < hi
+            _below = self.cumulative[np.minimum(mid, len(self.cumulative) - 1)] <= _x
+            lo = np.where(_open & _below, mid + 1, lo)
+            hi = np.where(_open & ~_below, mid, hi)
+
+        _observed = _x < _total
+        _uniform = np.minimum((_x - _total).astype(np.int64), self.N - 1)
+        return np.where(_observed, self.indices[np.minimum(lo, len(self.indices) - 1)], _uniform)
+
+    def row(self, season: int, state: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Observed transitions of a row.
+
+        Args:
+            season (int): season index
+            state (int): current state index
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: observed next states and their counts
+        """
+        _row = season * self.N + state
+        _start, _end = self.indptr[_row], self.indptr[_row + 1]
+        return self.indices[_start:_end], self.counts()[_start:_end]
+
+    def counts(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: number of observations of each stored transition
+        """
+        _counts = np.diff(self.cumulative, prepend=0)
+        _starts = self.indptr[:-1][np.diff(self.indptr) > 0]
+        _counts[_starts] = self.cumulative[_starts] # rows restart from zero
+        return _counts
+
+    def dense(self) -> np.ndarray:
+        """
+        Expands the model into transition matrices. Only sensible for small N.
+
+        Returns:
+            np.ndarray: transition matrices of shape (seasons, N, N)
+        """
+        _matrices = np.ones((self.seasons * self.N, self.N), dtype=self.cumulative.dtype)
+        _rows = np.repeat(np.arange(self.seasons * self.N), np.diff(self.indptr))
+        _matrices[_rows, self.indices] += self.counts()
+        _matrices /= (self.totals + self.N)[:, None]
+        return _matrices.reshape((self.seasons, self.N, self.N))
+
+    def push(self, season: int, distribution: np.ndarray) -> np.ndarray:
+        """
+        Distribution after one transition, distribution @ P in O(observed transitions + N):
+        the observed transitions are summed sparsely and the smoothing term, the same
+        for every next state of a row, once per row.
+
+        Args:
+            season (int): season index
+            distribution (np.ndarray): probability of each current state
+
+        Returns:
+            np.ndarray: probability of each next state
+        """
+        _first = season * self.N
+        _indptr = self.indptr[_first:_first + self.N + 1]
+        _scale = distribution / (self.totals[_first:_first + self.N] + self.N)
+        _rows = np.repeat(np.arange(self.N), np.diff(_indptr))
+        _observed = slice(_indptr[0], _indptr[-1])
+        _next = np.bincount(self.indices[_observed], _scale[_rows] * self.counts()[_observed], self.N)
+        return _next + _scale.sum()